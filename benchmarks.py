@@ -0,0 +1,343 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import tracemalloc
+import urllib.request
+import concurrent.futures
+import crawler
+import searchdata
+import search
+import sitegen
+import webdev
+
+
+def _synthetic_links(page, num_pages, out_degree, seed=1405):
+    """
+    Return the outgoing links of a page in a synthetic link graph.
+    Page i always links to page i+1 so every page is reachable from page 0;
+    the remaining links point at random pages.
+    """
+    rng = random.Random(seed * 1000003 + page)
+    links = ['N-%d.html' % ((page + 1) % num_pages)]
+    for _ in range(out_degree - 1):
+        links.append('N-%d.html' % rng.randrange(num_pages))
+    return links
+
+
+def _bfs_with_list(num_pages, out_degree):
+    """BFS over the synthetic graph using the original list queue and visited set"""
+    visited = set()
+    to_visit = ['N-0.html']
+    while to_visit:
+        url = to_visit.pop(0)
+        if url in visited:
+            continue
+        visited.add(url)
+        page = int(url[2:-5])
+        for link in _synthetic_links(page, num_pages, out_degree):
+            if link not in visited and link not in to_visit:
+                to_visit.append(link)
+    return len(visited)
+
+
+def _bfs_with_frontier(num_pages, out_degree):
+    """BFS over the synthetic graph using crawler._Frontier"""
+    to_visit = crawler._Frontier(['N-0.html'])
+    count = 0
+    while to_visit:
+        url = to_visit.pop()
+        count += 1
+        page = int(url[2:-5])
+        for link in _synthetic_links(page, num_pages, out_degree):
+            to_visit.push(link)
+    return count
+
+
+def bench_frontier(num_pages=1000000, out_degree=10, list_sizes=(5000, 10000, 20000)):
+    """
+    Compare the crawl frontier against the original list-based BFS queue.
+
+    The list version is quadratic, so it is only timed on the smaller
+    list_sizes graphs; the frontier is timed on those and on num_pages.
+
+    Args:
+        num_pages (int): Size of the largest synthetic link graph
+        out_degree (int): Outgoing links per page
+        list_sizes (tuple): Graph sizes to time the list version on
+    """
+    print('frontier benchmark, %d links per page' % out_degree)
+    for n in list(list_sizes) + [num_pages]:
+        start = time.perf_counter()
+        _bfs_with_frontier(n, out_degree)
+        frontier_time = time.perf_counter() - start
+
+        if n in list_sizes:
+            start = time.perf_counter()
+            _bfs_with_list(n, out_degree)
+            list_time = time.perf_counter() - start
+            print('%9d pages: list %8.3fs  frontier %8.3fs  (%.0fx)' % (n, list_time, frontier_time, list_time / frontier_time))
+        else:
+            print('%9d pages: list      n/a   frontier %8.3fs' % (n, frontier_time))
+
+
+def _synthetic_page(page, num_words, num_links, seed=1405):
+    """Return a large fruits-style HTML page with some extra markup mixed in"""
+    rng = random.Random(seed * 7919 + page)
+    vocab = ['apple', 'banana', 'coconut', 'kiwi', 'peach', 'pear', 'fig', 'lime', 'cherry', 'papaya']
+    parts = ['<html>\n<head><title>N-%d</title>\n<link rel="stylesheet" href="style.css">\n</head>\n<body>\n' % page]
+    words_left = num_words
+    links_left = num_links
+    while words_left > 0 or links_left > 0:
+        count = min(words_left, rng.randint(20, 80))
+        words_left -= count
+        parts.append('<div class="section">\n<p>\n%s\n</p>\n' % '\n'.join(rng.choice(vocab) for _ in range(count)))
+        for _ in range(min(links_left, rng.randint(1, 10))):
+            links_left -= 1
+            parts.append('<a href="./N-%d.html">N-%d</a> <abbr>x</abbr>\n' % (rng.randrange(100000), page))
+        parts.append('</div>\n')
+    parts.append('</body>\n</html>\n')
+    return ''.join(parts)
+
+
+def _parse_page_three_pass(content):
+    """The original parser: separate str.find sweeps for the title, words and links"""
+    title = ''
+    start_idx = content.find('<title>')
+    if start_idx != -1:
+        end_idx = content.find('</title>', start_idx + 7)
+        if end_idx != -1:
+            title = content[start_idx + 7:end_idx].strip()
+
+    words = []
+    start_pos = 0
+    while True:
+        p_start = content.find('<p>', start_pos)
+        if p_start == -1:
+            break
+        p_start += 3
+        p_end = content.find('</p>', p_start)
+        if p_end == -1:
+            break
+        words.extend(content[p_start:p_end].replace('\n', ' ').split())
+        start_pos = p_end + 4
+
+    links = []
+    start_pos = 0
+    while True:
+        a_start = content.find('<a', start_pos)
+        if a_start == -1:
+            break
+        href_start = content.find('href="', a_start)
+        if href_start == -1:
+            start_pos = a_start + 2
+            continue
+        href_start += 6
+        href_end = content.find('"', href_start)
+        if href_end == -1:
+            start_pos = a_start + 2
+            continue
+        links.append(content[href_start:href_end])
+        start_pos = href_end + 1
+
+    return title, words, links
+
+
+def _parse_decoded(parse):
+    """Wrap a str parser so it takes the page as UTF-8 bytes and decodes it first, as fetched pages were"""
+    return lambda content: parse(content.decode('utf-8'))
+
+
+def bench_parse(num_pages=200, num_words=20000, num_links=1000, repeat=3):
+    """
+    Compare the original three-pass parser and crawler._parse_page, which
+    both need the page decoded to a str first, against
+    crawler._parse_page_bytes on the raw bytes, on a corpus of large
+    synthetic pages. Checks all three give the same output, and reports
+    the peak memory allocated while parsing one page.
+
+    Args:
+        num_pages (int): Number of pages in the corpus
+        num_words (int): Words in <p> tags per page
+        num_links (int): Links per page
+        repeat (int): Timing runs; the best one is reported
+    """
+    corpus = [_synthetic_page(page, num_words, num_links).encode('utf-8') for page in range(num_pages)]
+    size = sum(len(content) for content in corpus)
+    parsers = (('three-pass', _parse_decoded(_parse_page_three_pass)),
+               ('single-pass', _parse_decoded(crawler._parse_page)),
+               ('bytes', crawler._parse_page_bytes))
+
+    for content in corpus:
+        results = [parse(content) for _, parse in parsers]
+        if any(result != results[0] for result in results):
+            raise AssertionError('parsers disagree on a synthetic page')
+
+    print('parse benchmark, %d pages, %.1f MB' % (num_pages, size / 1e6))
+    for name, parse in parsers:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for content in corpus:
+                parse(content)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        tracemalloc.start()
+        parse(corpus[0])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('%12s: %7.3fs  %7.1f MB/s  peak %6.2f MB per page' % (name, best, size / 1e6 / best, peak / 1e6))
+
+
+def _fetch_with_urlopen(url):
+    """The original fetch: a new connection per request"""
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+
+def _fetch_with_pool(url):
+    """webdev's fetch over pooled keep-alive connections, without retries or sleeps"""
+    return webdev._request(url, {})[2]
+
+
+def bench_fetch(num_pages=2000, workers=(1, 8)):
+    """
+    Compare fetch rates against a local server for a new connection per
+    request (urllib.request.urlopen) and webdev's keep-alive connection pool.
+
+    Args:
+        num_pages (int): Number of pages fetched per run
+        workers (tuple): Thread counts to run each fetcher with
+    """
+    site = sitegen.SiteServer({'N-%d.html' % page: _synthetic_page(page, 200, 10) for page in range(100)})
+    urls = [site.base_url + 'N-%d.html' % (page % 100) for page in range(num_pages)]
+
+    print('fetch benchmark, %d same-host pages' % num_pages)
+    try:
+        for count in workers:
+            rates = {}
+            for name, fetch in (('urlopen', _fetch_with_urlopen), ('keep-alive pool', _fetch_with_pool)):
+                with concurrent.futures.ThreadPoolExecutor(max_workers=count) as pool:
+                    start = time.perf_counter()
+                    list(pool.map(fetch, urls))
+                    rates[name] = num_pages / (time.perf_counter() - start)
+            print('%3d workers: urlopen %7.0f pages/s  keep-alive pool %7.0f pages/s  (%.1fx)'
+                  % (count, rates['urlopen'], rates['keep-alive pool'], rates['keep-alive pool'] / rates['urlopen']))
+    finally:
+        site.close()
+
+
+def bench_compression(num_pages=500, num_words=20000, workers=4):
+    """
+    Compare fetching text-heavy pages with and without gzip transfer encoding,
+    reporting bytes received against decompressed page bytes.
+
+    Args:
+        num_pages (int): Number of pages fetched per run
+        num_words (int): Words in <p> tags per page
+        workers (int): Number of fetcher threads
+    """
+    site = sitegen.SiteServer({'N-%d.html' % page: _synthetic_page(page, num_words, 100) for page in range(50)})
+    urls = [site.base_url + 'N-%d.html' % (page % 50) for page in range(num_pages)]
+    accept_encoding = webdev.ACCEPT_ENCODING
+
+    print('compression benchmark, %d pages of %d words' % (num_pages, num_words))
+    try:
+        for name, encoding in (('identity', 'identity'), ('gzip/deflate', accept_encoding)):
+            webdev.ACCEPT_ENCODING = encoding
+            webdev.reset_transfer_stats()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                start = time.perf_counter()
+                list(pool.map(_fetch_with_pool, urls))
+                elapsed = time.perf_counter() - start
+            stats = webdev.transfer_stats()
+            print('%12s: %8.1f MB received  %8.1f MB decoded  (%.1fx)  %6.0f pages/s'
+                  % (name, stats['wire_bytes'] / 1e6, stats['body_bytes'] / 1e6,
+                     stats['body_bytes'] / stats['wire_bytes'], num_pages / elapsed))
+    finally:
+        webdev.ACCEPT_ENCODING = accept_encoding
+        site.close()
+
+
+def _reset_searchdata():
+    """Drop searchdata's cached crawl data so it is reloaded from the current directory"""
+    searchdata._forget_crawl_data()
+
+
+def bench_crawl(num_pages=20000, workers=(1, 8, 32), output='jsonl'):
+    """
+    Crawl a synthetic fruits-style site served from localhost with
+    different numbers of fetcher threads.
+
+    Args:
+        num_pages (int): Number of pages in the site
+        workers (tuple): max_workers values to crawl with
+        output (str): crawl() output format
+    """
+    print('crawl benchmark, %d pages' % num_pages)
+    cwd = os.getcwd()
+    with sitegen.SiteServer(sitegen.SyntheticSite(num_pages), cache_size=0) as site:
+        for count in workers:
+            os.chdir(tempfile.mkdtemp(prefix='crawl_bench_'))
+            try:
+                start = time.perf_counter()
+                crawled = crawler.crawl(site.seed_url, max_workers=count, output=output, checkpoint_every=None)
+                elapsed = time.perf_counter() - start
+            finally:
+                os.chdir(cwd)
+            print('%3d workers: %7d pages in %7.2fs  %7.0f pages/s' % (count, crawled, elapsed, crawled / elapsed))
+
+
+def bench_search(num_pages=1000, queries=('apple', 'kiwi banana kiwi', 'pear fig coconut lime', 'tomato peach1')):
+    """
+    Time PageRank, IDF and search on a crawl of a synthetic site with
+    skewed link targets and a Zipf-distributed vocabulary.
+
+    Args:
+        num_pages (int): Number of pages in the site
+        queries (tuple): Search phrases to time
+    """
+    site = sitegen.SyntheticSite(num_pages, link_targets='zipf', vocab_size=200, word_distribution='zipf')
+    print('search benchmark, %d pages' % num_pages)
+    cwd = os.getcwd()
+    with sitegen.SiteServer(site) as server:
+        os.chdir(tempfile.mkdtemp(prefix='search_bench_'))
+        try:
+            crawler.crawl(server.seed_url, max_workers=8, checkpoint_every=None)
+            _reset_searchdata()
+
+            start = time.perf_counter()
+            searchdata.get_page_rank(server.seed_url)
+            print('%12s: %8.3fs' % ('PageRank', time.perf_counter() - start))
+
+            start = time.perf_counter()
+            searchdata.get_idf('apple')
+            print('%12s: %8.3fs' % ('IDF', time.perf_counter() - start))
+
+            for boost in (False, True):
+                start = time.perf_counter()
+                for phrase in queries:
+                    search.search(phrase, boost)
+                elapsed = time.perf_counter() - start
+                print('%12s: %8.3fs per query' % ('search' + (' boost' if boost else ''), elapsed / len(queries)))
+        finally:
+            os.chdir(cwd)
+            _reset_searchdata()
+
+
+BENCHMARKS = {
+    'frontier': bench_frontier,
+    'parse': bench_parse,
+    'fetch': bench_fetch,
+    'compression': bench_compression,
+    'crawl': bench_crawl,
+    'search': bench_search,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
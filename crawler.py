@@ -1,77 +1,1500 @@
 import os
+import sys
 import json
+import time
+import heapq
+import shutil
+import sqlite3
+import tempfile
+import asyncio
+import hashlib
+import functools
+import contextlib
+import collections
+import itertools
+import urllib.parse
+import concurrent.futures
 import webdev
+import searchdata
 
-def crawl(seed):
+# Files used to checkpoint a running crawl so it can be resumed
+CHECKPOINT_FILE = 'crawl_checkpoint.jsonl'
+JOURNAL_FILE = 'crawl_journal.jsonl'
+
+# Streaming crawl output written by crawl(seed, output='jsonl')
+JSONL_FILE = 'crawl_data.jsonl'
+
+# Pages that finish before pages taken off the frontier ahead of them wait
+# to be recorded in BFS order; at most this many per fetch slot are held
+REORDER_WINDOW = 64
+
+def crawl(seed, max_workers=1, memory_budget=None, resume=False, checkpoint_every=1000, parse_workers=0,
+          output='json', max_pages=None, deadline=None, progress=None, adaptive=False):
     """
     Performs web crawling starting from the seed URL.
     Finds all reachable pages, saves crawl data to files, and returns page count.
 
+    Up to max_workers pages are fetched concurrently. Fetched pages are still
+    recorded in the order they were taken off the BFS queue, so the saved
+    crawl data is identical to a sequential crawl. A page that finishes
+    early waits for the pages ahead of it while the freed worker goes on to
+    the next queued URL, so one slow page does not hold up the others (up
+    to REORDER_WINDOW pages per worker wait at a time).
+
+    With parse_workers > 0, parsing and link resolution run in a separate
+    pool of processes: fetcher threads hand the raw HTML straight to the
+    pool and move on to their next page, and only the parsed results come
+    back to this thread. Fetching and parsing then scale independently.
+
+    With output='jsonl' crawl data is not accumulated in memory while
+    crawling. Each page is appended to JSONL_FILE as soon as it is recorded
+    (see _JsonLinesOutput), and searchdata reads that file lazily. The
+    search index is built from the file once the crawl is over, and that
+    final step does take memory in proportion to the corpus. Likewise
+    with output='sqlite' each page is inserted into an SQLite database
+    (see _SqliteOutput), where searchdata answers each lookup with an
+    indexed query and several processes can read it at once.
+
+    If memory_budget is given, the frontier and seen-set keep at most that
+    many URLs in memory and spill the rest to disk (see _DiskFrontier).
+
+    A fetch that fails with a temporary error (a 5xx or 429 status, a
+    timeout or a network error) is not retried on the fetcher thread: the
+    URL goes back on the frontier with webdev's backoff delay and is fetched
+    again once that has passed, so a page that needed retries is recorded
+    later than in a sequential crawl. Permanent errors such as 404 are not
+    retried.
+
+    Every checkpoint_every pages the crawl state is checkpointed to disk
+    (see _Checkpoint). With resume=True a crawl of the same seed continues
+    from its last checkpoint instead of starting over; pages covered by the
+    checkpoint are not fetched again.
+
+    max_pages and deadline bound how far the crawl goes (see _Budget).
+    Once either is reached no more fetches are started, pages already in
+    flight are finished, and the pages crawled so far are saved as usual.
+    Each request is itself bounded by webdev's timeouts, so the crawl ends
+    at most one request's worth of time after the deadline.
+
+    With adaptive=True max_workers is only a ceiling: the number of
+    requests in flight to each host follows webdev.concurrency_limit, which
+    grows while the host answers quickly and is cut on timeouts and 5xx
+    responses (see _HostSlots). A page whose host is at its limit waits
+    for one of that host's requests to finish while other hosts' pages
+    are fetched; it keeps its place in the BFS order it is recorded in.
+
+    With progress=True a status line showing the pages crawled, pages per
+    second, queue depth and estimated time remaining is kept up to date on
+    stderr (see _Progress). By default it is shown when stderr is a
+    terminal. Per-request timings are collected by webdev either way (see
+    webdev.fetch_metrics).
+
     Args:
         seed (str): The starting URL for the crawl
+        max_workers (int): Maximum number of pages fetched at the same time
+        memory_budget (int): Maximum number of queued and seen URLs kept in memory,
+            or None to keep the whole frontier in memory
+        resume (bool): Whether to continue from the last checkpoint, if any
+        checkpoint_every (int): Pages crawled between checkpoints, or None
+            to disable checkpointing
+        parse_workers (int): Number of processes used to parse pages, or 0
+            to parse on this thread
+        output (str): 'json' to save JSON files at the end of the crawl,
+            'jsonl' to stream pages to JSONL_FILE as they are crawled, or
+            'sqlite' to insert them into searchdata.DATABASE_FILE
+        max_pages (int): Maximum number of pages to crawl, or None for no limit
+        deadline (float): Seconds after which no more fetches are started,
+            or None for no limit
+        progress (bool): Whether to show a progress line on stderr, or None
+            to show one if stderr is a terminal
+        adaptive (bool): Whether to adapt the number of requests in flight
+            to each host, up to max_workers
 
     Returns:
         int: Number of pages found during the crawl
     """
-    # Reset any existing data by deleting previous crawl files
-    _reset_crawl_data()
+    pipeline_size = max_workers + parse_workers  # pages being fetched or parsed
+    state = _CrawlState(seed, memory_budget, resume, checkpoint_every, output, max_pages, deadline,
+                        progress, adaptive, pipeline_size)
+    parse_pool = concurrent.futures.ProcessPoolExecutor(parse_workers) if parse_workers else None
+
+    # Perform BFS crawl, keeping up to max_workers fetches in flight
+    with state, parse_pool or contextlib.nullcontext(), \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while state.unfinished():
+            state.dispatch(lambda url, attempt: pool.submit(_fetch_page, url, attempt, parse_pool))
+
+            if not state.in_flight:
+                # Only retries are left, and none of them is due yet
+                time.sleep(state.idle_wait())
+                continue
+
+            # Collect whatever has finished, waiting only if the oldest page has not
+            done, _ = concurrent.futures.wait(state.running, timeout=state.wait_timeout(),
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                entry = state.running.pop(future)
+                if future is not entry[1]:
+                    entry[2] = (future.result(), None, False)  # parsed in the parse pool
+                    continue
+                state.hosts.release(entry[0])
+                fetched, retry_delay, parked = future.result()
+                if isinstance(fetched, concurrent.futures.Future):
+                    state.running[fetched] = entry
+                else:
+                    entry[2] = (fetched, retry_delay, parked)
+
+            state.record()
+
+    # Save all data to files
+    return state.finish()
+
+
+async def crawl_async(seed, concurrency=100, memory_budget=None, resume=False, checkpoint_every=1000,
+                      output='json', max_pages=None, deadline=None, progress=None, adaptive=False):
+    """
+    Performs the same crawl as crawl() on an asyncio event loop.
+    Pages are fetched with webdev.fetch_attempt_async, so many requests can
+    be in flight without a thread per request. The saved crawl data is
+    identical to crawl().
+
+    Args:
+        seed (str): The starting URL for the crawl
+        concurrency (int): Maximum number of requests in flight at the same time
+        memory_budget (int): Maximum number of queued and seen URLs kept in memory,
+            or None to keep the whole frontier in memory
+        resume (bool): Whether to continue from the last checkpoint, if any
+        checkpoint_every (int): Pages crawled between checkpoints, or None
+            to disable checkpointing
+        output (str): 'json' to save JSON files at the end of the crawl,
+            'jsonl' to stream pages to JSONL_FILE as they are crawled, or
+            'sqlite' to insert them into searchdata.DATABASE_FILE
+        max_pages (int): Maximum number of pages to crawl, or None for no limit
+        deadline (float): Seconds after which no more fetches are started,
+            or None for no limit
+        progress (bool): Whether to show a progress line on stderr, or None
+            to show one if stderr is a terminal
+        adaptive (bool): Whether to adapt the number of requests in flight
+            to each host, up to concurrency
+
+    Returns:
+        int: Number of pages found during the crawl
+    """
+    state = _CrawlState(seed, memory_budget, resume, checkpoint_every, output, max_pages, deadline,
+                        progress, adaptive, concurrency)
+
+    with state:
+        try:
+            while state.unfinished():
+                state.dispatch(lambda url, attempt: asyncio.ensure_future(
+                    webdev.fetch_attempt_async(url, attempt, decode=False)))
+
+                if not state.in_flight:
+                    # Only retries are left, and none of them is due yet
+                    await asyncio.sleep(state.idle_wait())
+                    continue
+
+                # Collect whatever has finished, waiting only if the oldest request has not
+                if state.running:
+                    done, _ = await asyncio.wait(state.running, timeout=state.wait_timeout(),
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        entry = state.running.pop(task)
+                        state.hosts.release(entry[0])
+                        response_status, headers, body, retry_delay = task.result()
+                        # Parse straight away, so only the page data waits to be recorded
+                        page = _parse_and_resolve(entry[0], body.obj, webdev.content_charset(headers), len(body)) \
+                            if body else None
+                        entry[2] = (page, retry_delay, response_status == webdev.PARKED)
+
+                state.record()
+        finally:
+            # Don't leave requests running if the crawl is cancelled
+            for task in state.running:
+                task.cancel()
+
+    return state.finish()
+
+
+def recrawl(seed, max_workers=1):
+    """
+    Brings the saved crawl data up to date with the site, refetching only
+    pages that changed since the last crawl or recrawl.
+
+    Every reachable page is requested with If-None-Match/If-Modified-Since
+    validators from the previous recrawl; pages that come back 304 or with
+    an unchanged content hash are not parsed again. Added, modified and
+    deleted pages are then applied as deltas to the saved pages, link
+    files and document frequencies, and searchdata updates any cached IDF
+    and PageRank values from those deltas. Falls back to a full crawl if
+    there is no saved crawl data.
+
+    As in crawl(), a fetch that fails with a temporary error is not retried
+    on the fetcher thread but goes back on the frontier with webdev's
+    backoff delay, and pages are handled in the order they were dequeued
+    whichever fetch finishes first.
+
+    Only crawl data saved with output='json' can be recrawled; crawl data
+    in another format is left alone rather than replaced by a JSON crawl.
+
+    Args:
+        seed (str): The starting URL for the crawl
+        max_workers (int): Maximum number of pages fetched at the same time
+
+    Returns:
+        int: Number of pages found during the recrawl
+
+    Raises:
+        ValueError: If the saved crawl data was written with output='jsonl'
+            or output='sqlite'
+    """
+    if not os.path.exists('pages_data.json'):
+        for filename, output in ((searchdata.DATABASE_FILE, 'sqlite'), (JSONL_FILE, 'jsonl')):
+            if os.path.exists(filename):
+                raise ValueError("recrawl() only updates crawl data saved with output='json', but %s was "
+                                 "saved with output=%r; crawl(seed, output=%r) crawls it again in full"
+                                 % (filename, output, output))
+        return crawl(seed, max_workers)
+
+    pages_data = _load_json('pages_data.json', {})
+    incoming_links = _load_json('incoming_links.json', {})
+    page_meta = _load_json('page_meta.json', {})  # URL -> {'etag', 'last_modified', 'hash'}
+    doc_freq = _load_json('doc_freq.json', None)
+    if doc_freq is None:
+        doc_freq = _count_doc_freq(pages_data)
+
+    changes = {}  # URL -> page data before the recrawl (None if added) for changed pages
+    reached = set()
+    pipeline = _Pipeline(_Frontier([seed]), max_workers)
+
+    def start(url, attempt):
+        if url not in pages_data:
+            return pool.submit(_refetch_page, url, {}, None, attempt)
+        meta = page_meta.get(url)
+        return pool.submit(_refetch_page, url, _conditional_headers(meta), meta and meta.get('hash'), attempt)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pipeline.unfinished():
+            pipeline.dispatch(start)
+
+            if not pipeline.in_flight:
+                # Only retries are left, and none of them is due yet
+                time.sleep(pipeline.idle_wait())
+                continue
+
+            done, _ = concurrent.futures.wait(pipeline.running, timeout=pipeline.wait_timeout(),
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                entry = pipeline.running.pop(future)
+                pipeline.hosts.release(entry[0])
+                entry[2] = future.result()
+
+            for current_url, (status, headers, content_hash, new_page) in pipeline.finished():
+                old_page = pages_data.get(current_url)
+
+                if status == 304:
+                    if old_page is None:
+                        continue  # nothing to compare against, so it is dropped like an unreadable page
+                    absolute_outgoing = old_page['outgoing_links']
+                else:
+                    if new_page is None:
+                        absolute_outgoing = old_page['outgoing_links']  # same content hash as before
+                    else:
+                        absolute_outgoing = new_page['outgoing_links']
+                        if new_page != old_page:
+                            changes[current_url] = old_page
+                            pages_data[current_url] = new_page
+                    page_meta[current_url] = {
+                        'etag': headers.get('etag'),
+                        'last_modified': headers.get('last-modified'),
+                        'hash': content_hash
+                    }
+
+                reached.add(current_url)
+                for link in absolute_outgoing:
+                    pipeline.to_visit.push(link)
+
+    # Pages that are no longer reachable have been deleted
+    for url in list(pages_data):
+        if url not in reached:
+            changes[url] = pages_data.pop(url)
+            page_meta.pop(url, None)
+
+    links_changed = _apply_page_changes(changes, pages_data, incoming_links, doc_freq)
+
+    _save_crawl_data(pages_data, incoming_links, doc_freq)
+    with open('page_meta.json', 'w') as f:
+        json.dump(page_meta, f)
+
+    searchdata._update_derived_data(links_changed)
+
+    return len(pages_data)
+
+
+def _conditional_headers(meta):
+    """Build conditional GET headers from the validators saved for a page"""
+    headers = {}
+    if meta and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    return headers
+
+
+def _apply_page_changes(changes, pages_data, incoming_links, doc_freq):
+    """
+    Apply added, modified and deleted pages to the incoming links and
+    document frequencies.
+
+    Args:
+        changes (dict): URL -> previous page data (None if the page was added);
+            pages missing from pages_data were deleted
+        pages_data (dict): URL -> current page data mapping
+        incoming_links (dict): URL -> list of incoming URLs mapping to update
+        doc_freq (dict): word -> number of pages containing it, to update
+
+    Returns:
+        bool: True if the link graph changed
+    """
+    links_changed = False
+    touched = set()  # link targets whose incoming links changed
+
+    for url, old_page in changes.items():
+        new_page = pages_data.get(url)
+        old_links = old_page['outgoing_links'] if old_page else []
+        new_links = new_page['outgoing_links'] if new_page else []
+        if old_page is None or new_page is None or old_links != new_links:
+            links_changed = True
+
+        # Move this page's contribution to the incoming links of its targets
+        new_targets = set(new_links)
+        for target in set(old_links) - new_targets:
+            incoming_links[target].remove(url)
+            touched.add(target)
+        for target in new_links:
+            incoming_links.setdefault(target, [])
+            if url not in incoming_links[target]:
+                incoming_links[target].append(url)
+
+        # Move this page's contribution to the document frequencies
+        for word in searchdata._term_counts(old_page) if old_page else []:
+            doc_freq[word] -= 1
+            if doc_freq[word] == 0:
+                del doc_freq[word]
+        for word in searchdata._term_counts(new_page) if new_page else []:
+            doc_freq[word] = doc_freq.get(word, 0) + 1
+
+        touched.add(url)
+
+    # Keep the same keys a full crawl would: every crawled page plus every link target
+    for url in touched:
+        if url in pages_data:
+            incoming_links.setdefault(url, [])
+        elif not incoming_links.get(url):
+            incoming_links.pop(url, None)
+
+    return links_changed
+
+
+def _fetch_page(url, attempt=0, parse_pool=None):
+    """
+    Make one attempt at fetching a page and parse it. Runs on a fetcher thread.
+
+    The body is read into the thread's reusable buffer and parsed straight
+    from there (see _parse_page_bytes), so the page is never decoded as a
+    whole; with a parse pool it is copied out once to send to the pool.
+
+    Args:
+        url (str): The URL to fetch
+        attempt (int): Number of earlier failed attempts at url
+        parse_pool (Executor): Optional process pool to parse the page in
+
+    Returns:
+        tuple: (fetched, retry_delay, parked). fetched is the page data from
+        _parse_and_resolve, or with a parse pool the Future of it, so the
+        fetcher is free again straight away; it is None if the page could
+        not be read. retry_delay is the number of seconds to wait before
+        trying url again, or None if there is nothing to retry. parked is
+        True if no request was made because the host's circuit breaker is
+        open, so the retry does not count as an attempt.
+    """
+    status, headers, body, retry_delay = webdev.fetch_attempt(url, attempt=attempt, decode=False)
+    if not body:
+        return None, retry_delay, status == webdev.PARKED
+    charset = webdev.content_charset(headers)
+    if parse_pool is None:
+        return _parse_and_resolve(url, body.obj, charset, len(body)), retry_delay, False
+    return parse_pool.submit(_parse_and_resolve, url, bytes(body), charset), retry_delay, False
 
-    # Initialize data structures
-    pages_data = {}  # URL -> {'title': str, 'words': list, 'outgoing_links': list}
-    visited = set()
-    to_visit = [seed]
-    incoming_links = {}  # URL -> list of URLs that link to it
 
-    # Perform BFS crawl
-    while to_visit:
-        current_url = to_visit.pop(0)
+def _refetch_page(url, headers, old_hash, attempt=0):
+    """
+    Make one conditional attempt at fetching a page for recrawl() and parse
+    it if its content changed. Runs on a fetcher thread.
 
-        if current_url in visited:
-            continue
+    Args:
+        url (str): The URL to fetch
+        headers (dict): Conditional request headers for the page
+        old_hash (str): Content hash saved for the page, or None if it is new
+        attempt (int): Number of earlier failed attempts at url
 
-        visited.add(current_url)
+    Returns:
+        tuple: (fetched, retry_delay, parked) as from _fetch_page. fetched is
+        (status, headers, content_hash, page), where page is None if the page
+        came back 304 or with content hash old_hash, or None if the page could
+        not be read.
+    """
+    status, response_headers, page_content, retry_delay = webdev.fetch_attempt(url, headers, attempt)
+    if status == 304:
+        return (status, response_headers, None, None), None, False
+    if not page_content:
+        return None, retry_delay, status == webdev.PARKED
+    content_hash = hashlib.sha1(page_content.encode('utf-8')).hexdigest()
+    page = None if content_hash == old_hash else _parse_and_resolve(url, page_content)
+    return (status, response_headers, content_hash, page), None, False
 
-        # Fetch page content
-        page_content = webdev.read_url(current_url)
-        if not page_content:
-            continue
 
-        # Parse page content
+def _parse_and_resolve(current_url, page_content, charset=None, end=None):
+    """
+    Parse a fetched page into its page data, counting its words and making
+    its links absolute. Has no side effects, so it can run in a worker process.
+
+    Args:
+        current_url (str): The URL the page was fetched from
+        page_content (str or bytes): Raw HTML content of the page, either
+            decoded or as bytes/bytearray in the given charset
+        charset (str): Charset of page_content if it is not decoded
+        end (int): Length of the page if page_content is a buffer that is
+            only partly filled, or None to use all of it
+
+    Returns:
+        dict: Page data, {'title': str, 'term_counts': dict, 'word_count': int,
+            'outgoing_links': list}
+    """
+    # Parse page content
+    if isinstance(page_content, str):
         title, words, outgoing_links = _parse_page(page_content)
+    else:
+        title, words, outgoing_links = _parse_page_bytes(page_content, charset, end)
+
+    # Count each word now so term frequencies are lookups at search time
+    term_counts = {}
+    for word in words:
+        term_counts[word] = term_counts.get(word, 0) + 1
+
+    # Convert relative links to absolute
+    absolute_outgoing = [_to_absolute_url(link, current_url) for link in outgoing_links]
+
+    return {
+        'title': title,
+        'term_counts': term_counts,
+        'word_count': len(words),
+        'outgoing_links': absolute_outgoing
+    }
+
+
+class _Pipeline:
+    """
+    URLs taken off a frontier and fetched concurrently, handed back in the
+    order they were dequeued, so what is built from them is the same as
+    with one fetch at a time.
+
+    in_flight holds an [url, handle, result] entry for every URL taken off
+    the frontier but not yet handed back, in the order the URLs were
+    dequeued. handle is the future or task fetching (or parsing) the page,
+    and result is set to (page, retry delay, parked) once it has finished,
+    with page None if there is nothing to hand back. running maps each
+    unfinished future or task to its entry. At most REORDER_WINDOW times
+    the pipeline size of entries are held back waiting for an older one.
+
+    A fetch that is to be retried puts its URL back on the frontier with
+    the retry delay instead of waiting for it, so neither a retry nor an
+    unavailable host holds up the pages behind it.
+    """
+
+    def __init__(self, to_visit, pipeline_size, hosts=None, budget=None):
+        self.to_visit = to_visit
+        self.hosts = hosts or _HostSlots()
+        self.budget = budget or _Budget()
+        self.pipeline_size = pipeline_size
+        self.window = pipeline_size * REORDER_WINDOW
+        self.in_flight = collections.deque()
+        self.running = {}
+        self.pages = 0  # pages handed back so far
+
+    def unfinished(self):
+        """Return True while pages are in flight or the budget allows fetching queued ones"""
+        return bool(self.in_flight) or (bool(self.to_visit) and self.budget.allows(self.pages))
+
+    def dispatch(self, start):
+        """
+        Starts fetches until the pipeline is full: first of pages whose host
+        now has a free slot, then of URLs taken off the frontier.
+
+        Args:
+            start (callable): Called with a URL and its attempt number to start
+                fetching it; returns the future or task to wait on
+        """
+        while len(self.running) < self.pipeline_size and self.budget.allows(self.pages):
+            entry = self.hosts.next_waiting()
+            if entry is None:
+                if not (self.to_visit.ready() and len(self.in_flight) < self.window and
+                        self.budget.allows(self.pages + len(self.in_flight))):
+                    break
+                entry = [self.to_visit.pop(), None, None]
+                self.in_flight.append(entry)
+                if not self.hosts.admit(entry[0], entry):
+                    continue  # its host is at its limit
+            entry[1] = start(entry[0], self.to_visit.attempts(entry[0]))
+            self.running[entry[1]] = entry
+
+    def idle_wait(self):
+        """Return how long to sleep when nothing is in flight and no retry is due yet"""
+        return self.budget.wait(self.to_visit.retry_wait())
+
+    def wait_timeout(self):
+        """Return the timeout for waiting on running fetches: none unless the oldest page has finished"""
+        return None if self.in_flight[0][2] is None else 0
+
+    def finished(self):
+        """
+        Hands back the finished pages at the front of in_flight, putting
+        URLs to retry back on the frontier.
+
+        Yields:
+            tuple: (url, page) for each page, in the order the URLs were dequeued
+        """
+        if not self.budget.allows(self.pages):
+            # No more fetches start, so pages waiting for a host slot are skipped
+            for entry in self.hosts.drain():
+                entry[2] = (None, None, False)
+
+        while self.in_flight and self.in_flight[0][2] is not None:
+            current_url, _, (page, retry_delay, parked) = self.in_flight.popleft()
+            if retry_delay is not None:
+                self.to_visit.retry(current_url, retry_delay, failed=not parked)
+                continue
+            if page is None:
+                continue
+            self.pages += 1
+            yield current_url, page
+
+
+class _CrawlState(_Pipeline):
+    """
+    The frontier, output, checkpoints and pages in flight of one crawl,
+    shared by crawl() and crawl_async(), which differ only in how a page is
+    fetched and how they wait for fetches to finish. Pages are recorded in
+    the order they were dequeued (see _Pipeline), so the saved data is the
+    same as a sequential crawl's.
+
+    Used as a context manager, it opens the output on entry and closes the
+    frontier, output and checkpoint file on exit.
+    """
+
+    def __init__(self, seed, memory_budget, resume, checkpoint_every, output, max_pages, deadline,
+                 progress, adaptive, pipeline_size):
+        super().__init__(_make_frontier([], memory_budget), pipeline_size,
+                         _HostSlots(adaptive), _Budget(max_pages, deadline))
+        self.status = _Progress(progress, max_pages)
+        self.output = _make_output(output, journal=checkpoint_every is not None)
+        self.checkpoint = _Checkpoint(seed, checkpoint_every, self.output)
+
+        # Continue from the last checkpoint, or reset any existing data by
+        # deleting previous crawl files. Either way the crawl files change,
+        # so searchdata must not keep anything it loaded from them.
+        if resume and self.checkpoint.load(self.to_visit):
+            searchdata._forget_crawl_data()
+        else:
+            _reset_crawl_data()
+            self.to_visit.push(seed)
+            self.checkpoint.add_url(seed)
+        self.pages = len(self.output)
+
+    def record(self):
+        """Record the finished pages at the front of in_flight, queueing their new links"""
+        for current_url, page in self.finished():
+            self.output.add_page(current_url, page)
+
+            # Add links that have never been queued before
+            for link in page['outgoing_links']:
+                if self.to_visit.push(link):
+                    self.checkpoint.add_url(link)
+
+            self.checkpoint.save_if_due(self.to_visit, [entry[0] for entry in self.in_flight])
+            self.status.update(len(self.output), len(self.to_visit), len(self.running))
+
+    def finish(self):
+        """Save the crawl data, remove the checkpoint and return the number of pages crawled"""
+        self.status.finish(len(self.output))
+        self.output.finish()
+        self.checkpoint.remove()
+        return len(self.output)
+
+    def __enter__(self):
+        self.output.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.to_visit.close()
+        self.output.close()
+        self.checkpoint.close()
+
+
+class _Budget:
+    """
+    Limits on how far a crawl goes: at most max_pages pages are crawled,
+    and no fetch is started more than deadline seconds after the crawl began.
+    """
+
+    def __init__(self, max_pages=None, deadline=None):
+        self.max_pages = max_pages
+        self.stop_at = None if deadline is None else time.monotonic() + deadline
+
+    def allows(self, pages):
+        """Return True if another fetch may start, given the number of pages crawled or in flight"""
+        if self.max_pages is not None and pages >= self.max_pages:
+            return False
+        return self.stop_at is None or time.monotonic() < self.stop_at
+
+    def wait(self, seconds):
+        """Shorten a wait so it ends no later than the deadline"""
+        if self.stop_at is None:
+            return seconds
+        return max(0, min(seconds, self.stop_at - time.monotonic()))
+
+
+class _HostSlots:
+    """
+    Per-host limits on the requests a crawl has in flight.
+
+    When adaptive, each host may have at most webdev.concurrency_limit
+    requests in flight, a limit webdev adjusts as responses come back. An
+    item taken off the frontier whose host is at its limit waits in that
+    host's queue until one of the host's requests is released, while
+    other hosts' URLs go ahead, so one slow or saturated host does not
+    hold up the rest. Items are handed back in the order they were queued
+    for each host. When not adaptive nothing waits and only the crawl's
+    own limit applies.
+    """
+
+    def __init__(self, adaptive=False):
+        self.adaptive = adaptive
+        self._in_flight = collections.Counter()
+        self._waiting = {}  # host -> deque of (url, item) waiting for a slot, oldest first
+        self._ready = collections.deque()  # hosts that may have a free slot for a waiting item
+
+    def admit(self, url, item):
+        """Take a slot for url's host and return True, or queue item to wait for one and return False"""
+        if not self.adaptive:
+            return True
+        host = _host(url)
+        if host in self._waiting or self._in_flight[host] >= webdev.concurrency_limit(url):
+            self._waiting.setdefault(host, collections.deque()).append((url, item))
+            return False
+        self._in_flight[host] += 1
+        return True
+
+    def next_waiting(self):
+        """Return the oldest waiting item of a host that now has a free slot, taking the slot, or None"""
+        while self._ready:
+            host = self._ready.popleft()
+            waiting = self._waiting.get(host)
+            if not waiting or self._in_flight[host] >= webdev.concurrency_limit(waiting[0][0]):
+                continue
+            _, item = waiting.popleft()
+            self._in_flight[host] += 1
+            if not waiting:
+                del self._waiting[host]
+            elif self._in_flight[host] < webdev.concurrency_limit(waiting[0][0]):
+                self._ready.appendleft(host)
+            return item
+        return None
+
+    def release(self, url):
+        """Free the slot taken for url once its request has finished"""
+        if self.adaptive:
+            host = _host(url)
+            self._in_flight[host] -= 1
+            if host in self._waiting:
+                self._ready.append(host)
+            elif not self._in_flight[host]:
+                del self._in_flight[host]
+
+    def drain(self):
+        """Remove and return every waiting item, e.g. once no more fetches will be started"""
+        items = [item for waiting in self._waiting.values() for _, item in waiting]
+        self._waiting.clear()
+        self._ready.clear()
+        return items
+
+
+def _host(url):
+    """Return the host[:port] of a URL, as webdev keys its per-host state"""
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+class _Progress:
+    """
+    A one-line crawl status on stderr, redrawn in place at most every
+    interval seconds:
+
+        1200 pages  310.4 pages/s  queue 5321  in flight 32  ETA 0:00:17
+
+    The rate is averaged over the whole crawl so far. The ETA is the time
+    to crawl everything queued at that rate (or up to max_pages, if that
+    comes first), so it grows while the crawl is still discovering pages.
+    """
+
+    def __init__(self, enabled=None, max_pages=None, interval=0.5, stream=None):
+        self.stream = stream or sys.stderr
+        self.enabled = self.stream.isatty() if enabled is None else enabled
+        self.max_pages = max_pages
+        self.interval = interval
+        self.started = time.monotonic()
+        self.shown_at = 0.0
+        self.shown = False
+
+    def update(self, pages, queued, in_flight):
+        """Redraw the line if it is due, given the pages crawled and the URLs queued and in flight"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now - self.shown_at < self.interval:
+            return
+        self.shown_at = now
+        self.shown = True
+        self.stream.write('\r' + self.line(pages, queued, in_flight, now - self.started) + '\033[K')
+        self.stream.flush()
+
+    def finish(self, pages):
+        """Replace the line with the final page count and rate"""
+        if not self.enabled:
+            return
+        elapsed = time.monotonic() - self.started
+        self.stream.write('\r%d pages in %.1fs  %.1f pages/s\033[K\n' % (pages, elapsed, pages / elapsed if elapsed else 0))
+        self.stream.flush()
+
+    def line(self, pages, queued, in_flight, elapsed):
+        """Return the status line for the given counts after elapsed seconds"""
+        rate = pages / elapsed if elapsed else 0
+        remaining = queued + in_flight
+        if self.max_pages is not None:
+            remaining = min(remaining, max(0, self.max_pages - pages))
+        eta = '%d:%02d:%02d' % _hms(remaining / rate) if rate else '?'
+        return '%d pages  %.1f pages/s  queue %d  in flight %d  ETA %s' % (pages, rate, queued, in_flight, eta)
+
+
+def _hms(seconds):
+    """Split seconds into (hours, minutes, seconds)"""
+    minutes, seconds = divmod(int(seconds), 60)
+    return minutes // 60, minutes % 60, seconds
+
+
+class _Frontier:
+    """
+    BFS queue of URLs to visit.
+
+    Every URL that has ever been pushed is remembered, so a URL is queued
+    at most once. Pushing, popping and membership tests are all O(1).
 
-        # Convert relative links to absolute
-        absolute_outgoing = []
-        for link in outgoing_links:
-            abs_link = _to_absolute_url(link, current_url)
-            absolute_outgoing.append(abs_link)
-
-            # Track incoming links
-            if abs_link not in incoming_links:
-                incoming_links[abs_link] = []
-            if current_url not in incoming_links[abs_link]:
-                incoming_links[abs_link].append(current_url)
-
-        # Store page data
-        pages_data[current_url] = {
-            'title': title,
-            'words': words,
-            'outgoing_links': absolute_outgoing
+    URLs whose fetch failed with a temporary error can be handed back with
+    retry(); they wait out their backoff delay here rather than on a fetcher
+    thread, and pop() returns them ahead of the queue once they are due.
+    """
+
+    def __init__(self, urls=()):
+        self._queue = collections.deque()
+        self._seen = set()  # URLs that have been queued, including ones already popped
+        self._retries = []  # heap of (due time, sequence number, URL) waiting to be retried
+        self._retry_order = itertools.count()
+        self._attempts = {}  # URL -> failed attempts so far, for URLs that have been retried
+        for url in urls:
+            self.push(url)
+
+    def push(self, url):
+        """Queue url unless it has been queued before. Returns True if it was queued."""
+        if not self._mark_seen(url):
+            return False
+        self._enqueue(url)
+        return True
+
+    def pop(self):
+        """Remove and return a retry that is due, or else the oldest queued URL"""
+        if self._retries and self._retries[0][0] <= time.monotonic():
+            return heapq.heappop(self._retries)[2]
+        return self._dequeue()
+
+    def retry(self, url, delay, failed=True):
+        """
+        Queue a URL that has already been popped again, delay seconds from
+        now. failed is False if no request was made (webdev.PARKED), so
+        the retry does not count as an attempt.
+        """
+        if failed:
+            self._attempts[url] = self._attempts.get(url, 0) + 1
+        heapq.heappush(self._retries, (time.monotonic() + delay, next(self._retry_order), url))
+
+    def attempts(self, url):
+        """Return the number of failed attempts at url that were retried"""
+        return self._attempts.get(url, 0)
+
+    def ready(self):
+        """Return True if pop() has a URL to return right now"""
+        return self._queue_length() > 0 or (bool(self._retries) and self._retries[0][0] <= time.monotonic())
+
+    def retry_wait(self):
+        """Return the number of seconds until the next retry is due"""
+        if not self._retries:
+            return 0
+        return max(0, self._retries[0][0] - time.monotonic())
+
+    def restore(self, queued, seen):
+        """
+        Load a saved frontier into this (empty) frontier.
+
+        Args:
+            queued (iterable): URLs still waiting to be visited, oldest first
+            seen (iterable): Every URL that had been queued, including popped ones
+        """
+        for url in seen:
+            self._mark_seen(url)
+        for url in queued:
+            self._enqueue(url)
+
+    def iter_queued(self):
+        """Yield the URLs waiting to be visited: pending retries, then the queue oldest first"""
+        yield from self.iter_retries()
+        yield from self._iter_queue()
+
+    def iter_retries(self):
+        """Yield the URLs waiting to be retried, soonest first"""
+        for _, _, url in sorted(self._retries):
+            yield url
+
+    def iter_seen(self):
+        """Yield every URL that has been queued"""
+        return iter(self._seen)
+
+    def __len__(self):
+        return self._queue_length() + len(self._retries)
+
+    def __contains__(self, url):
+        return url in self._seen
+
+    def _mark_seen(self, url):
+        """Add url to the seen-set. Returns False if it was already there."""
+        if url in self._seen:
+            return False
+        self._seen.add(url)
+        return True
+
+    def _enqueue(self, url):
+        """Append url to the queue without checking the seen-set"""
+        self._queue.append(url)
+
+    def _dequeue(self):
+        """Remove and return the oldest queued URL"""
+        return self._queue.popleft()
+
+    def _queue_length(self):
+        """Return the number of queued URLs, not counting retries"""
+        return len(self._queue)
+
+    def _iter_queue(self):
+        """Yield the queued URLs, oldest first, not counting retries"""
+        return iter(self._queue)
+
+    def close(self):
+        """Release any resources held by the frontier"""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _DiskFrontier(_Frontier):
+    """
+    Crawl frontier that keeps a bounded number of URLs in memory.
+
+    The queue is held as an in-memory head (oldest URLs) and tail (newest
+    URLs); whenever the tail fills up it is written out as an append-only
+    segment file, and segments are read back in order as the head drains.
+    The seen-set moves into an SQLite table once it outgrows its share of
+    the budget. Memory use is therefore bounded by memory_budget no matter
+    how many URLs the crawl discovers.
+    """
+
+    def __init__(self, urls=(), memory_budget=100000, directory=None):
+        self._dir = tempfile.mkdtemp(prefix='crawl_frontier_', dir=directory)
+        self._segment_size = max(1, memory_budget // 4)  # head and tail each hold one segment
+        self._seen_limit = max(1, memory_budget // 2)
+        self._head = collections.deque()
+        self._tail = []
+        self._segments = collections.deque()  # segment file paths, oldest first
+        self._next_segment = 0
+        self._length = 0
+        self._db = None  # SQLite seen-set, created once the in-memory one is too big
+        super().__init__(urls)
+
+    def _enqueue(self, url):
+        """Append url to the queue, spilling the tail to disk when it is full"""
+        self._tail.append(url)
+        self._length += 1
+        if len(self._tail) >= self._segment_size:
+            self._spill_tail()
+
+    def _dequeue(self):
+        """Remove and return the oldest queued URL"""
+        if not self._head:
+            if self._segments:
+                self._head.extend(self._read_segment(self._segments.popleft()))
+            else:
+                self._head.extend(self._tail)
+                self._tail = []
+        self._length -= 1
+        return self._head.popleft()
+
+    def _iter_queue(self):
+        """Yield the queued URLs, oldest first, not counting retries"""
+        yield from self._head
+        for path in self._segments:
+            with open(path, 'r') as f:
+                for line in f:
+                    yield json.loads(line)
+        yield from self._tail
+
+    def iter_seen(self):
+        """Yield every URL that has been queued"""
+        if self._db is None:
+            yield from self._seen
+        else:
+            for (url,) in self._db.execute('SELECT url FROM seen'):
+                yield url
+
+    def _queue_length(self):
+        """Return the number of queued URLs, not counting retries"""
+        return self._length
+
+    def __contains__(self, url):
+        if self._db is None:
+            return url in self._seen
+        return self._db.execute('SELECT 1 FROM seen WHERE url = ?', (url,)).fetchone() is not None
+
+    def close(self):
+        """Delete the spill files"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _mark_seen(self, url):
+        """Add url to the seen-set. Returns False if it was already there."""
+        if self._db is None:
+            if url in self._seen:
+                return False
+            self._seen.add(url)
+            if len(self._seen) > self._seen_limit:
+                self._spill_seen()
+            return True
+
+        cursor = self._db.execute('INSERT OR IGNORE INTO seen (url) VALUES (?)', (url,))
+        return cursor.rowcount == 1
+
+    def _spill_seen(self):
+        """Move the in-memory seen-set into an SQLite table"""
+        self._db = sqlite3.connect(os.path.join(self._dir, 'seen.db'))
+        self._db.execute('PRAGMA journal_mode = OFF')
+        self._db.execute('PRAGMA synchronous = OFF')
+        self._db.execute('CREATE TABLE seen (url TEXT PRIMARY KEY) WITHOUT ROWID')
+        self._db.executemany('INSERT INTO seen (url) VALUES (?)', ((url,) for url in self._seen))
+        self._seen = set()
+
+    def _spill_tail(self):
+        """Write the tail of the queue out as a new segment file"""
+        path = os.path.join(self._dir, 'segment-%d.jsonl' % self._next_segment)
+        self._next_segment += 1
+        with open(path, 'w') as f:
+            for url in self._tail:
+                f.write(json.dumps(url) + '\n')
+        self._segments.append(path)
+        self._tail = []
+
+    def _read_segment(self, path):
+        """Read a segment file back into a list of URLs and delete it"""
+        with open(path, 'r') as f:
+            urls = [json.loads(line) for line in f]
+        os.remove(path)
+        return urls
+
+
+def _make_frontier(urls, memory_budget):
+    """Create an in-memory frontier, or a disk-backed one if memory_budget is set"""
+    if memory_budget is None:
+        return _Frontier(urls)
+    return _DiskFrontier(urls, memory_budget)
+
+
+class _Checkpoint:
+    """
+    Periodic on-disk checkpoints of a running crawl.
+
+    Every `every` pages the crawl output is synced to disk and a checkpoint
+    of the frontier and the output's sync state (how much of its journal
+    is durable) is added to CHECKPOINT_FILE. Loading a checkpoint restores
+    the output to that state, so pages recorded after the last checkpoint
+    are simply fetched again.
+
+    CHECKPOINT_FILE is JSON Lines: a header object, then every URL as it is
+    first queued, with a checkpoint record object following the URLs
+    queued before it. As the queue is first in, first out, the URLs still
+    queued at a checkpoint are the last ones written before its record,
+    from its queue_start on; the record itself lists only the URLs that
+    are being fetched or waiting for a retry. A checkpoint therefore only
+    appends what changed since the previous one. The file is rewritten
+    from the frontier on resuming and whenever the records take up more of
+    it than the URLs do, so its size stays proportional to the frontier.
+    """
+
+    def __init__(self, seed, every, crawl_output):
+        self.seed = seed
+        self.every = every
+        self.output = crawl_output
+        self._saved_pages = 0  # pages recorded as of the last checkpoint
+        self._file = None  # CHECKPOINT_FILE, open for appending
+        self._urls = 0  # URLs in the file
+        self._url_bytes = 0  # size of the URL lines
+        self._record_bytes = 0  # size of the header and checkpoint records
+
+    def load(self, frontier):
+        """
+        Restore the last checkpoint of a crawl of this seed.
+
+        Args:
+            frontier (_Frontier): Empty frontier to restore the queue into
+
+        Returns:
+            bool: True if a checkpoint was loaded
+        """
+        if not os.path.exists(CHECKPOINT_FILE):
+            return False
+
+        with open(CHECKPOINT_FILE, 'r') as f:
+            # A crawl that died before writing its header leaves nothing to resume from
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return False
+            if not isinstance(header, dict) or header.get('seed') != self.seed or \
+                    header.get('output') != self.output.NAME:
+                return False
+
+            # Find the last checkpoint; anything after it was written by a crawl that stopped before the next one
+            record = None
+            urls = 0
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                if line.startswith('{'):
+                    record = json.loads(line)
+                    saved_urls = urls
+                else:
+                    urls += 1
+        if record is None:
+            return False
+
+        queued = itertools.chain(record['pending'], self._read_urls(record['queue_start'], saved_urls))
+        frontier.restore(queued, self._read_urls(0, saved_urls))
+
+        self.output.restore(record['state'])
+        self._saved_pages = len(self.output)
+        self._rewrite(frontier, [], record['state'])
+        return True
+
+    def add_url(self, url):
+        """Note a URL that has just been queued for the first time"""
+        if self.every is None:
+            return
+        if self._file is None:
+            self._start(CHECKPOINT_FILE)
+        self._write_url(url)
+
+    def save_if_due(self, frontier, in_flight):
+        """
+        Write a checkpoint if `every` pages have been recorded since the last one.
+
+        Args:
+            frontier (_Frontier): The crawl frontier
+            in_flight (list): URLs popped from the frontier but not yet recorded,
+                oldest first
+        """
+        if self.every is None or len(self.output) - self._saved_pages < self.every:
+            return
+
+        state = self.output.sync()
+        if self._record_bytes > self._url_bytes:
+            self._rewrite(frontier, in_flight, state)
+        else:
+            self._write_record(frontier, in_flight, state)
+
+        self._saved_pages = len(self.output)
+
+    def remove(self):
+        """Delete the checkpoint file once the crawl has finished"""
+        self.close()
+        if os.path.exists(CHECKPOINT_FILE):
+            os.remove(CHECKPOINT_FILE)
+
+    def close(self):
+        """Close the checkpoint file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _start(self, path):
+        """Start a new checkpoint file at path with its header"""
+        self._file = open(path, 'w')
+        line = json.dumps({'seed': self.seed, 'output': self.output.NAME}) + '\n'
+        self._file.write(line)
+        self._file.flush()
+        self._urls = self._url_bytes = 0
+        self._record_bytes = len(line)
+
+    def _write_url(self, url):
+        line = json.dumps(url) + '\n'
+        self._file.write(line)
+        self._urls += 1
+        self._url_bytes += len(line)
+
+    def _write_record(self, frontier, in_flight, state):
+        """Append a checkpoint record and make the file durable"""
+        retries = list(frontier.iter_retries())
+        record = {
+            'state': state,
+            'queue_start': self._urls - (len(frontier) - len(retries)),
+            'pending': list(in_flight) + retries
         }
+        line = json.dumps(record) + '\n'
+        self._file.write(line)
+        self._record_bytes += len(line)
+        self._file.flush()
+        os.fsync(self._file.fileno())
 
-        # Add unvisited links to queue
-        for link in absolute_outgoing:
-            if link not in visited and link not in to_visit:
-                to_visit.append(link)
+    def _rewrite(self, frontier, in_flight, state):
+        """Replace the checkpoint file with one holding just the current frontier and a checkpoint of it"""
+        self.close()
+        temp_file = CHECKPOINT_FILE + '.tmp'
+        self._start(temp_file)
+        # The queue goes last, so it is the tail of the URLs like in a file built up by add_url
+        for url in itertools.chain(frontier.iter_seen(), frontier.iter_queued()):
+            self._write_url(url)
+        self._write_record(frontier, in_flight, state)
+        self.close()
+        os.replace(temp_file, CHECKPOINT_FILE)
+        self._file = open(CHECKPOINT_FILE, 'a')
 
-    # Initialize incoming links for pages that have no incoming links
-    for url in pages_data:
-        if url not in incoming_links:
-            incoming_links[url] = []
+    def _read_urls(self, start, stop):
+        """Yield the URLs in the checkpoint file from index start up to index stop"""
+        with open(CHECKPOINT_FILE, 'r') as f:
+            f.readline()
+            index = 0
+            for line in f:
+                if index >= stop:
+                    break
+                if not line.startswith('{'):
+                    if index >= start:
+                        yield json.loads(line)
+                    index += 1
 
-    # Save all data to files
-    _save_crawl_data(pages_data, incoming_links)
+    def __enter__(self):
+        return self
 
-    return len(pages_data)
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _JsonOutput:
+    """
+    Crawl output kept in memory and saved as JSON files by _save_crawl_data
+    when the crawl finishes.
+
+    Pages are kept in a searchdata._InvertedIndex, with URLs and terms
+    interned as integer ids in flat arrays, and only turned back into
+    strings as the files are written.
+
+    When journaling, each page is also appended to JOURNAL_FILE so that a
+    checkpoint can recover the pages crawled so far.
+    """
+
+    NAME = 'json'
+
+    def __init__(self, journal=True):
+        self.index = searchdata._InvertedIndex()
+        self._journaling = journal
+        self._journal = None
+
+    def open(self):
+        """Open the journal for appending"""
+        if self._journaling and self._journal is None:
+            self._journal = open(JOURNAL_FILE, 'ab')
+
+    def add_page(self, url, page):
+        """Record a crawled page"""
+        self.index.add(url, page)
+        if self._journal is not None:
+            record = [url, page]
+            self._journal.write((json.dumps(record) + '\n').encode('utf-8'))
+
+    def sync(self):
+        """Flush the journal to disk and return the state to restore it to"""
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        return {'journal_size': self._journal.tell()}
+
+    def restore(self, state):
+        """Reload the pages journaled as of a sync() state"""
+        # Drop pages journaled after the checkpoint; they are still queued
+        with open(JOURNAL_FILE, 'r+b') as f:
+            f.truncate(state['journal_size'])
+
+        with open(JOURNAL_FILE, 'r') as f:
+            for line in f:
+                url, page = json.loads(line)
+                self.index.add(url, page)
+
+    def finish(self):
+        """Save the crawl data files and delete the journal"""
+        self.close()
+
+        _save_crawl_data(self.index.pages(), self.index.incoming_links(), self.index.doc_freqs(), self.index)
+
+        if os.path.exists(JOURNAL_FILE):
+            os.remove(JOURNAL_FILE)
+
+    def close(self):
+        """Close the journal"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _JsonLinesOutput:
+    """
+    Crawl output streamed to JSONL_FILE as pages are recorded.
+
+    Each page is written as
+        {"type": "page", "url": ..., "title": ..., "term_counts": {...}, ...}
+    followed by one {"type": "link", "from": ..., "to": ...} record for each
+    distinct page it links to. Only the document frequencies are kept in
+    memory while crawling, so the crawl's memory use is bounded by its
+    frontier. The search index is built from the output file once the
+    crawl is over; that step holds the whole index in memory before it is
+    written (every URL, title and posting; several times the size of the
+    index file), so the peak memory of a JSONL crawl grows with the corpus
+    after all. The output file also serves as the checkpoint journal.
+    """
+
+    NAME = 'jsonl'
+
+    def __init__(self):
+        self.doc_freq = {}  # word -> number of pages containing it
+        self._file = None
+        self._pages = 0
+
+    def open(self):
+        """Open the output file for appending"""
+        if self._file is None:
+            self._file = open(JSONL_FILE, 'ab')
+
+    def add_page(self, url, page):
+        """Append a crawled page and its link edges to the output file"""
+        lines = [json.dumps(dict({'type': 'page', 'url': url}, **page))]
+        for target in dict.fromkeys(page['outgoing_links']):
+            lines.append(json.dumps({'type': 'link', 'from': url, 'to': target}))
+        self._file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+
+        for word in page['term_counts']:
+            self.doc_freq[word] = self.doc_freq.get(word, 0) + 1
+        self._pages += 1
+
+    def sync(self):
+        """Flush the output file to disk and return the state to restore it to"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {'size': self._file.tell(), 'pages': self._pages}
+
+    def restore(self, state):
+        """Cut the output file back to a sync() state"""
+        with open(JSONL_FILE, 'r+b') as f:
+            f.truncate(state['size'])
+        self._pages = state['pages']
+        # Counted again rather than saved at every checkpoint, as they grow with the vocabulary
+        self.doc_freq = _count_doc_freq(searchdata._JsonLinesPages(JSONL_FILE))
+
+    def finish(self):
+        """
+        Close the output file, save the document frequencies and build the
+        search index from the file. Needs memory for the whole index.
+        """
+        self.close()
+        with open('doc_freq.json', 'w') as f:
+            json.dump(self.doc_freq, f)
+        index = searchdata._InvertedIndex()
+        for url, page in searchdata._JsonLinesPages(JSONL_FILE).items():
+            index.add(url, page)
+        index.save(searchdata.INDEX_FILE)
+
+    def close(self):
+        """Close the output file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return self._pages
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _SqliteOutput:
+    """
+    Crawl output written to the SQLite database searchdata.DATABASE_FILE
+    as pages are recorded.
+
+    Each page goes into the pages, edges and postings tables described in
+    searchdata._open_database, with its links and words interned in the
+    urls and terms tables. Only the term ids and document frequencies are
+    kept in memory. Rows are committed at every checkpoint and when the
+    crawl ends, and the database also serves as the checkpoint journal.
+    """
+
+    NAME = 'sqlite'
+
+    def __init__(self):
+        self._db = None
+        self._term_ids = {}  # term -> term id
+        self._doc_freq = {}  # term id -> number of pages containing it
+        self._pages = 0
+
+    def open(self):
+        """Open the database, creating it if needed"""
+        if self._db is None:
+            self._db = searchdata._open_database(searchdata.DATABASE_FILE)
+            self._db.execute('PRAGMA synchronous = NORMAL')
+            self._load_state()
+
+    def add_page(self, url, page):
+        """Insert a crawled page with its links and postings"""
+        doc = self._pages
+        self._db.execute('INSERT INTO pages (doc, url, title, word_count) VALUES (?, ?, ?, ?)',
+                         (doc, self._url_id(url), page['title'], page['word_count']))
+        self._db.executemany('INSERT INTO edges (source, position, target) VALUES (?, ?, ?)',
+                             [(doc, position, self._url_id(link)) for position, link in enumerate(page['outgoing_links'])])
+
+        postings = []
+        for word, count in page['term_counts'].items():
+            term = self._term_ids.get(word)
+            if term is None:
+                term = self._term_ids[word] = self._db.execute(
+                    'INSERT INTO terms (term, doc_freq) VALUES (?, 0)', (word,)).lastrowid
+            self._doc_freq[term] = self._doc_freq.get(term, 0) + 1
+            postings.append((term, doc, count))
+        self._db.executemany('INSERT INTO postings (term, doc, count) VALUES (?, ?, ?)', postings)
+        self._pages += 1
+
+    def sync(self):
+        """Commit everything recorded so far and return the state to restore it to"""
+        self._save_doc_freq()
+        self._db.commit()
+        return {'pages': self._pages}
+
+    def restore(self, state):
+        """Delete pages recorded after a sync() state"""
+        self.open()
+        pages = state['pages']
+        with self._db:
+            self._db.execute('DELETE FROM edges WHERE source >= ?', (pages,))
+            self._db.execute('DELETE FROM postings WHERE doc >= ?', (pages,))
+            self._db.execute('DELETE FROM pages WHERE doc >= ?', (pages,))
+            self._db.execute('UPDATE terms SET doc_freq = (SELECT COUNT(*) FROM postings WHERE term = terms.id)')
+            self._db.execute('DELETE FROM terms WHERE doc_freq = 0')
+            self._db.execute('DELETE FROM urls WHERE id NOT IN (SELECT url FROM pages) '
+                             'AND id NOT IN (SELECT target FROM edges)')
+        self._load_state()
+
+    def finish(self):
+        """Commit the crawl and close the database"""
+        self.close()
+
+    def close(self):
+        """Commit and close the database"""
+        if self._db is not None:
+            self._save_doc_freq()
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def _load_state(self):
+        """Read the term ids, document frequencies and page count back from the database"""
+        self._term_ids = {}
+        self._doc_freq = {}
+        for term, word, doc_freq in self._db.execute('SELECT id, term, doc_freq FROM terms'):
+            self._term_ids[word] = term
+            self._doc_freq[term] = doc_freq
+        self._pages = searchdata._database_page_count(self._db)
+
+    def _save_doc_freq(self):
+        """Write the document frequencies counted in memory to the terms table"""
+        self._db.executemany('UPDATE terms SET doc_freq = ? WHERE id = ?',
+                             ((doc_freq, term) for term, doc_freq in self._doc_freq.items()))
+
+    def _url_id(self, url):
+        """Return the URL id of a URL, adding it to the urls table if it is new"""
+        self._db.execute('INSERT OR IGNORE INTO urls (url) VALUES (?)', (url,))
+        return self._db.execute('SELECT id FROM urls WHERE url = ?', (url,)).fetchone()[0]
+
+    def __len__(self):
+        return self._pages
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _make_output(output, journal):
+    """
+    Create the crawl output for an output format name.
+    journal says whether a JSON output should journal pages for checkpoints;
+    JSON Lines and SQLite outputs are always their own journal.
+    """
+    if output == 'json':
+        return _JsonOutput(journal)
+    if output == 'jsonl':
+        return _JsonLinesOutput()
+    if output == 'sqlite':
+        return _SqliteOutput()
+    raise ValueError("output must be 'json', 'jsonl' or 'sqlite', not %r" % (output,))
 
 
 def _reset_crawl_data():
@@ -81,10 +1504,23 @@ def _reset_crawl_data():
         'incoming_links.json',
         'outgoing_links.json',
         'page_rank.json',
+        searchdata.PAGE_RANK_FILE,
         'idf_data.json',
-        'tf_data.json'
+        'tf_data.json',
+        'doc_freq.json',
+        'page_meta.json',
+        searchdata.INDEX_FILE,
+        searchdata.DATABASE_FILE,
+        searchdata.DATABASE_FILE + '-wal',
+        searchdata.DATABASE_FILE + '-shm',
+        CHECKPOINT_FILE,
+        JOURNAL_FILE,
+        JSONL_FILE
     ]
 
+    # Let go of the files searchdata has open, and the values it computed from them, before they are deleted
+    searchdata._forget_crawl_data()
+
     for filename in files_to_remove:
         if os.path.exists(filename):
             os.remove(filename)
@@ -94,98 +1530,137 @@ def _parse_page(content):
     """
     Parse HTML content to extract title, words from <p> tags, and outgoing links.
 
+    The document is scanned once from left to right. The title, paragraph
+    and link extractors each keep the position of the next tag they are
+    waiting for, and whichever comes first in the document is handled next,
+    so no part of the document is searched twice for the same tag:
+    - the title is the stripped text between the first <title> and the
+      next </title>
+    - words are the whitespace-separated words between each <p> and the
+      next </p>; an unclosed <p> ends word extraction
+    - links are the first href="..." value at or after each <a that is not
+      inside a previous link's href value
+
     Args:
         content (str): Raw HTML content
 
     Returns:
         tuple: (title, words_list, outgoing_links_list)
     """
-    title = _extract_title(content)
-    words = _extract_words(content)
-    outgoing_links = _extract_links(content)
-
-    return title, words, outgoing_links
-
-
-def _extract_title(content):
-    """Extract title from <title> tags"""
-    start_tag = '<title>'
-    end_tag = '</title>'
-
-    start_idx = content.find(start_tag)
-    if start_idx == -1:
-        return ""
+    title = ""
+    words = []
+    links = []
 
-    start_idx += len(start_tag)
-    end_idx = content.find(end_tag, start_idx)
-    if end_idx == -1:
-        return ""
+    # Position of the next tag each extractor is waiting for, -1 when done
+    title_pos = content.find('<title>')
+    p_pos = content.find('<p>')
+    a_pos = content.find('<a')
 
-    return content[start_idx:end_idx].strip()
+    while True:
+        if p_pos != -1 and (a_pos == -1 or p_pos < a_pos) and (title_pos == -1 or p_pos < title_pos):
+            # Words from the paragraph starting here
+            p_end = content.find('</p>', p_pos + 3)
+            if p_end == -1:
+                p_pos = -1
+                continue
+            words.extend(content[p_pos + 3:p_end].split())
+            p_pos = content.find('<p>', p_end + 4)
 
+        elif a_pos != -1 and (title_pos == -1 or a_pos < title_pos):
+            # Link from the first href="..." after this <a
+            href_start = content.find('href="', a_pos)
+            href_end = content.find('"', href_start + 6) if href_start != -1 else -1
+            if href_end == -1:
+                # No complete href="..." anywhere after this point
+                a_pos = -1
+                continue
+            links.append(content[href_start + 6:href_end])
+            a_pos = content.find('<a', href_end + 1)
 
-def _extract_words(content):
-    """Extract words from <p> tags"""
-    words = []
-    start_pos = 0
+        elif title_pos != -1:
+            title_end = content.find('</title>', title_pos + 7)
+            if title_end != -1:
+                title = content[title_pos + 7:title_end].strip()
+            title_pos = -1
 
-    while True:
-        # Find next <p> tag
-        p_start = content.find('<p>', start_pos)
-        if p_start == -1:
+        else:
             break
 
-        p_start += 3  # Skip <p>
-
-        # Find corresponding </p>
-        p_end = content.find('</p>', p_start)
-        if p_end == -1:
-            break
+    return title, words, links
 
-        # Extract text between <p> and </p>
-        p_content = content[p_start:p_end]
 
-        # Split into words (by spaces and newlines)
-        p_words = p_content.replace('\n', ' ').split()
-        words.extend(p_words)
+def _parse_page_bytes(content, charset='utf-8', end=None):
+    """
+    Parse undecoded HTML the same way as _parse_page.
 
-        start_pos = p_end + 4  # Skip </p>
+    The tags are searched for in the raw bytes, and only the text that is
+    extracted (the title, each paragraph and each href value) is decoded,
+    so the page is never decoded or copied as a whole. Bytes that are not
+    valid in the charset are replaced rather than failing the page. Pages
+    in charsets that do not encode ASCII as single bytes (such as UTF-16)
+    are decoded and passed to _parse_page.
 
-    return words
+    Args:
+        content (bytes or bytearray): Raw HTML content
+        charset (str): Charset the page is encoded in
+        end (int): Number of bytes of content that belong to the page, or
+            None to use all of it
 
+    Returns:
+        tuple: (title, words_list, outgoing_links_list)
+    """
+    if end is None:
+        end = len(content)
+    if not _ascii_compatible(charset):
+        return _parse_page(bytes(content[:end]).decode(charset, 'replace'))
 
-def _extract_links(content):
-    """Extract outgoing links from <a href="..."> tags"""
+    title = ""
+    words = []
     links = []
-    start_pos = 0
+
+    # Position of the next tag each extractor is waiting for, -1 when done
+    title_pos = content.find(b'<title>', 0, end)
+    p_pos = content.find(b'<p>', 0, end)
+    a_pos = content.find(b'<a', 0, end)
 
     while True:
-        # Find next <a tag
-        a_start = content.find('<a', start_pos)
-        if a_start == -1:
-            break
+        if p_pos != -1 and (a_pos == -1 or p_pos < a_pos) and (title_pos == -1 or p_pos < title_pos):
+            p_end = content.find(b'</p>', p_pos + 3, end)
+            if p_end == -1:
+                p_pos = -1
+                continue
+            words.extend(content[p_pos + 3:p_end].decode(charset, 'replace').split())
+            p_pos = content.find(b'<p>', p_end + 4, end)
 
-        # Find href="
-        href_start = content.find('href="', a_start)
-        if href_start == -1:
-            start_pos = a_start + 2
-            continue
+        elif a_pos != -1 and (title_pos == -1 or a_pos < title_pos):
+            href_start = content.find(b'href="', a_pos, end)
+            href_end = content.find(b'"', href_start + 6, end) if href_start != -1 else -1
+            if href_end == -1:
+                a_pos = -1
+                continue
+            links.append(content[href_start + 6:href_end].decode(charset, 'replace'))
+            a_pos = content.find(b'<a', href_end + 1, end)
 
-        href_start += 6  # Skip href="
+        elif title_pos != -1:
+            title_end = content.find(b'</title>', title_pos + 7, end)
+            if title_end != -1:
+                title = content[title_pos + 7:title_end].decode(charset, 'replace').strip()
+            title_pos = -1
 
-        # Find closing "
-        href_end = content.find('"', href_start)
-        if href_end == -1:
-            start_pos = a_start + 2
-            continue
+        else:
+            break
 
-        # Extract link
-        link = content[href_start:href_end]
-        links.append(link)
+    return title, words, links
 
-        start_pos = href_end + 1
 
-    return links
+@functools.lru_cache(maxsize=None)
+def _ascii_compatible(charset):
+    """Return True if charset encodes the tags _parse_page_bytes looks for as plain ASCII bytes"""
+    markup = '<title></title><p></p><a href=""'
+    try:
+        return markup.encode(charset) == markup.encode('ascii')
+    except (LookupError, UnicodeError):
+        return False
 
 
 def _to_absolute_url(link, base_url):
@@ -218,26 +1693,71 @@ def _to_absolute_url(link, base_url):
     return base_path + relative_path
 
 
-def _save_crawl_data(pages_data, incoming_links):
+def _save_crawl_data(pages_data, incoming_links, doc_freq=None, index=None):
     """
     Save all crawl data to JSON files for use by searchdata.py
 
     Args:
-        pages_data (dict): URL -> page data mapping
-        incoming_links (dict): URL -> list of incoming URLs mapping
+        pages_data (Mapping): URL -> page data mapping
+        incoming_links (Mapping): URL -> list of incoming URLs mapping
+        doc_freq (dict): word -> number of pages containing it, or None to
+            count it from pages_data
+        index (searchdata._InvertedIndex): Index of exactly pages_data and
+            incoming_links to save as the search index, or None to build it
     """
-    # Save pages data (titles, words, outgoing links)
+    # Save pages data (titles, term counts, outgoing links)
     with open('pages_data.json', 'w') as f:
-        json.dump(pages_data, f)
+        _dump_items(pages_data.items(), f)
 
     # Save incoming links
     with open('incoming_links.json', 'w') as f:
-        json.dump(incoming_links, f)
+        _dump_items(incoming_links.items(), f)
 
     # Create outgoing links mapping for convenience
-    outgoing_links = {}
+    with open('outgoing_links.json', 'w') as f:
+        _dump_items(((url, data['outgoing_links']) for url, data in pages_data.items()), f)
+
+    # Save document frequencies so IDF never needs a pass over every page
+    if doc_freq is None:
+        doc_freq = _count_doc_freq(pages_data)
+
+    with open('doc_freq.json', 'w') as f:
+        json.dump(doc_freq, f)
+
+    # Save the search index, which searchdata reads instead of the JSON files
+    if index is not None:
+        index.save(searchdata.INDEX_FILE)
+        return
+    index = searchdata._InvertedIndex()
     for url, data in pages_data.items():
-        outgoing_links[url] = data['outgoing_links']
+        index.add(url, data)
+    index.save(searchdata.INDEX_FILE, incoming_links)
 
-    with open('outgoing_links.json', 'w') as f:
-        json.dump(outgoing_links, f)
+
+def _dump_items(items, f):
+    """Write (key, value) pairs to a file as the JSON object json.dump would write for a dict of them, a pair at a time"""
+    f.write('{')
+    for i, (key, value) in enumerate(items):
+        if i:
+            f.write(', ')
+        f.write(json.dumps(key))
+        f.write(': ')
+        f.write(json.dumps(value))
+    f.write('}')
+
+
+def _count_doc_freq(pages_data):
+    """Count the number of pages each word appears in"""
+    doc_freq = {}
+    for data in pages_data.values():
+        for word in searchdata._term_counts(data):
+            doc_freq[word] = doc_freq.get(word, 0) + 1
+    return doc_freq
+
+
+def _load_json(filename, default):
+    """Load a JSON file, or return default if it does not exist"""
+    if not os.path.exists(filename):
+        return default
+    with open(filename, 'r') as f:
+        return json.load(f)
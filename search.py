@@ -6,6 +6,13 @@ def search(phrase, boost):
     Perform search using vector space model and cosine similarity.
     Returns top 10 results sorted by score (descending).
 
+    Only pages containing at least one query word are scored, using the
+    crawler's inverted index, so a search takes time in proportion to the
+    number of matching pages rather than the size of the crawl. Every
+    other page scores 0; if fewer than 10 pages score above 0, the results
+    are made up to 10 with pages scoring 0 in crawl order, exactly as if
+    every page had been scored.
+
     Args:
         phrase (str): Search query (space-separated words)
         boost (bool): Whether to boost content score by PageRank
@@ -19,55 +26,74 @@ def search(phrase, boost):
     if not query_words:
         return []
 
-    # Get all crawled pages
-    pages_data = _load_pages_data()
-    if not pages_data:
+    # Get the index of all crawled pages
+    index = searchdata._load_inverted_index()
+    if not len(index):
         return []
 
-    urls = list(pages_data.keys())
-
     # Build query vector (TF-IDF weights for unique words)
     query_vector, unique_query_words = _build_query_vector(query_words)
 
-    # Compute scores for each document
-    results = []
-    for url in urls:
-        # Get document vector (TF-IDF weights for unique query words)
-        doc_vector = [searchdata.get_tf_idf(url, word) for word in unique_query_words]
+    # Build the document vector of every page containing a query word
+    doc_vectors = _matching_doc_vectors(index, unique_query_words)
 
+    # Compute scores for each matching document
+    scores = {}
+    for doc, doc_vector in doc_vectors.items():
         # Compute cosine similarity
         similarity = _cosine_similarity(query_vector, doc_vector)
 
         # Apply PageRank boost if requested
         if boost:
-            page_rank = searchdata.get_page_rank(url)
+            page_rank = searchdata._doc_page_rank(index, doc)
             if page_rank == -1:  # URL not found
                 page_rank = 0
             similarity *= page_rank
 
-        # Get page title
-        title = pages_data[url].get('title', '')
+        if similarity > 0:
+            scores[doc] = similarity
 
+    # Sort by score descending, ties in crawl order, then make up 10 with pages scoring 0
+    top_docs = sorted(scores, key=lambda doc: (-scores[doc], doc))[:10]
+    for doc in range(len(index)):
+        if len(top_docs) >= 10:
+            break
+        if doc not in scores:
+            top_docs.append(doc)
+
+    results = []
+    for doc in top_docs:
         results.append({
-            'url': url,
-            'title': title,
-            'score': similarity
+            'url': index.url(doc),
+            'title': index.title(doc),
+            'score': scores.get(doc, 0.0)
         })
+    return results
 
-    # Sort by score descending and return top 10
-    results.sort(key=lambda x: x['score'], reverse=True)
-    return results[:10]
 
+def _matching_doc_vectors(index, unique_query_words):
+    """
+    Build the TF-IDF vector of each page containing at least one query word.
+    Weights are computed as searchdata.get_tf_idf does, from the term counts
+    and page lengths in the index.
 
-def _load_pages_data():
-    """Load pages data (similar to searchdata internal function)"""
-    import os
-    import json
+    Args:
+        index (searchdata._MappedIndex or searchdata._InvertedIndex): Search index of the crawl
+        unique_query_words (list): Distinct words in the query
 
-    if os.path.exists('pages_data.json'):
-        with open('pages_data.json', 'r') as f:
-            return json.load(f)
-    return {}
+    Returns:
+        dict: doc id -> vector of TF-IDF weights for unique_query_words
+    """
+    doc_vectors = {}
+    for i, word in enumerate(unique_query_words):
+        idf = searchdata.get_idf(word)
+        for doc, count in index.matches(word):
+            doc_vector = doc_vectors.get(doc)
+            if doc_vector is None:
+                doc_vector = doc_vectors[doc] = [0.0] * len(unique_query_words)
+            tf = count / index.length(doc)
+            doc_vector[i] = math.log(1 + tf, 2) * idf  # Same formula as get_tf_idf
+    return doc_vectors
 
 
 def _build_query_vector(query_words):
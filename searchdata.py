@@ -1,7 +1,14 @@
 import os
+import sys
 import json
 import math
-import matmult
+import mmap
+import array
+import struct
+import sqlite3
+import functools
+import itertools
+import collections.abc
 
 # Global variables to cache loaded data
 _pages_data = None
@@ -10,34 +17,896 @@ _outgoing_links = None
 _page_rank_cache = None
 _idf_cache = None
 _tf_cache = None
+_inverted_index = None
+_saved_page_ranks = None
+
+# Search index saved by the crawler alongside the page data (see _MappedIndex)
+INDEX_FILE = 'search_index.bin'
+_INDEX_MAGIC = b'SRCHIDX1'
+_INDEX_SECTIONS = ('url_offsets', 'url_strings', 'url_order', 'url_docs', 'doc_urls', 'title_offsets',
+                   'title_strings', 'lengths', 'term_offsets', 'term_strings', 'doc_freqs', 'posting_offsets',
+                   'postings', 'term_count_offsets', 'term_counts', 'outgoing_offsets', 'outgoing',
+                   'incoming_offsets', 'incoming')
+_NO_DOC = 0xFFFFFFFF  # url_docs entry of a URL that was not crawled
+
+# PageRank of each document of the search index, as little-endian doubles
+# in doc id order, so one page's rank is read without loading the others
+PAGE_RANK_FILE = 'page_rank.bin'
+
+# SQLite database written by crawler.crawl(seed, output='sqlite'), shared safely
+# by any number of processes (see _open_database)
+DATABASE_FILE = 'crawl_data.db'
+_database = None
+_DATABASE_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS urls (id INTEGER PRIMARY KEY, url TEXT NOT NULL UNIQUE)',
+    'CREATE TABLE IF NOT EXISTS pages (doc INTEGER PRIMARY KEY, url INTEGER NOT NULL UNIQUE REFERENCES urls (id), '
+    'title TEXT NOT NULL, word_count INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS edges (source INTEGER NOT NULL REFERENCES pages (doc), position INTEGER NOT NULL, '
+    'target INTEGER NOT NULL REFERENCES urls (id), PRIMARY KEY (source, position)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS edges_by_target ON edges (target, source)',
+    'CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE, doc_freq INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS postings (term INTEGER NOT NULL REFERENCES terms (id), '
+    'doc INTEGER NOT NULL REFERENCES pages (doc), count INTEGER NOT NULL, PRIMARY KEY (term, doc)) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS metrics (name TEXT NOT NULL, key INTEGER NOT NULL, value REAL NOT NULL, '
+    'PRIMARY KEY (name, key)) WITHOUT ROWID',
+)
+
+# How every page record in a streamed crawl (crawl_data.jsonl) starts
+_JSONL_PAGE_PREFIX = b'{"type": "page", "url": '
 
 def _load_pages_data():
-    """Load pages data from JSON file"""
+    """Load pages data from JSON file, or lazily from a streamed crawl"""
     global _pages_data
-    if _pages_data is None and os.path.exists('pages_data.json'):
-        with open('pages_data.json', 'r') as f:
-            _pages_data = json.load(f)
+    if _pages_data is None:
+        if os.path.exists('pages_data.json'):
+            with open('pages_data.json', 'r') as f:
+                _pages_data = json.load(f)
+        elif os.path.exists('crawl_data.jsonl'):
+            _pages_data = _JsonLinesPages('crawl_data.jsonl')
     return _pages_data or {}
 
 
 def _load_incoming_links():
-    """Load incoming links data from JSON file"""
+    """Load incoming links data from the crawl database, the search index, a JSON file, or a streamed crawl"""
     global _incoming_links
-    if _incoming_links is None and os.path.exists('incoming_links.json'):
-        with open('incoming_links.json', 'r') as f:
-            _incoming_links = json.load(f)
+    if _incoming_links is None:
+        if _load_database() is not None:
+            _incoming_links = _DatabaseLinks(_load_database(), outgoing=False)
+        elif _load_saved_index() is not None:
+            _incoming_links = _load_saved_index().incoming_links
+        elif os.path.exists('incoming_links.json'):
+            with open('incoming_links.json', 'r') as f:
+                _incoming_links = json.load(f)
+        elif os.path.exists('crawl_data.jsonl'):
+            _incoming_links = _load_jsonl_incoming_links('crawl_data.jsonl')
     return _incoming_links or {}
 
 
 def _load_outgoing_links():
-    """Load outgoing links data from JSON file"""
+    """Load outgoing links data from the crawl database, the search index, a JSON file, or a streamed crawl"""
     global _outgoing_links
-    if _outgoing_links is None and os.path.exists('outgoing_links.json'):
-        with open('outgoing_links.json', 'r') as f:
-            _outgoing_links = json.load(f)
+    if _outgoing_links is None:
+        if _load_database() is not None:
+            _outgoing_links = _DatabaseLinks(_load_database(), outgoing=True)
+        elif _load_saved_index() is not None:
+            _outgoing_links = _load_saved_index().outgoing_links
+        elif os.path.exists('outgoing_links.json'):
+            with open('outgoing_links.json', 'r') as f:
+                _outgoing_links = json.load(f)
+        elif os.path.exists('crawl_data.jsonl'):
+            _outgoing_links = _FieldView(_load_pages_data(), 'outgoing_links')
     return _outgoing_links or {}
 
 
+def _load_inverted_index():
+    """Open the crawl database or the search index saved by the crawler, or build an index in memory from the page data"""
+    global _inverted_index
+    if _load_database() is not None:
+        return _DatabaseIndex(_load_database())
+    if _load_saved_index() is None and _inverted_index is None:
+        # Crawl data saved before the crawler wrote an index
+        _inverted_index = _InvertedIndex()
+        for url, page in _load_pages_data().items():
+            _inverted_index.add(url, page)
+    return _inverted_index
+
+
+def _load_saved_index():
+    """Return the search index saved by the crawler, opened with mmap, or None if there is none"""
+    global _inverted_index
+    if _inverted_index is None and os.path.exists(INDEX_FILE):
+        _inverted_index = _MappedIndex(INDEX_FILE)
+    return _inverted_index if isinstance(_inverted_index, _MappedIndex) else None
+
+
+def _close_inverted_index():
+    """
+    Close and forget the loaded search index, the link views over it and
+    the PageRanks of its documents, e.g. before its file is replaced
+    """
+    global _inverted_index, _incoming_links, _outgoing_links, _saved_page_ranks
+    if isinstance(_inverted_index, _MappedIndex):
+        _inverted_index.close()
+        if isinstance(_incoming_links, _LinkView):
+            _incoming_links = None
+        if isinstance(_outgoing_links, _LinkView):
+            _outgoing_links = None
+    _inverted_index = None
+    if _saved_page_ranks is not None:
+        _saved_page_ranks.close()
+        _saved_page_ranks = None
+
+
+def _crawled_urls():
+    """Return the URLs of the crawled pages, in crawl order"""
+    db = _load_database()
+    if db is not None:
+        return [url for url, in db.execute('SELECT u.url FROM pages p JOIN urls u ON u.id = p.url ORDER BY p.doc')]
+    index = _load_saved_index()
+    if index is not None:
+        return [index.url(doc) for doc in range(len(index))]
+    return list(_load_pages_data().keys())
+
+
+def _load_database():
+    """Return a connection to the crawl database, or None if the crawl did not write one"""
+    global _database
+    if _database is None and os.path.exists(DATABASE_FILE):
+        _database = _open_database(DATABASE_FILE)
+    return _database
+
+
+def _open_database(path):
+    """
+    Open a crawl database, creating its tables if they do not exist.
+
+    The database is in WAL mode, so readers in other processes are never
+    blocked by the crawler writing to it, and a writer waits for another
+    writer's transaction rather than failing.
+
+    Tables (doc ids number the crawled pages in crawl order):
+    - urls: every URL seen, crawled pages and link targets, by URL id
+    - pages: doc id -> URL id, title and number of words
+    - edges: the outgoing links of each page in order, as URL ids,
+      indexed by target for incoming links
+    - terms: term id -> term and number of pages containing it
+    - postings: (term id, doc id) -> number of times the term is on the page
+    - metrics: values derived from the rest, such as each page's PageRank,
+      by metric name and doc id
+    """
+    db = sqlite3.connect(path, timeout=60)
+    db.execute('PRAGMA journal_mode = WAL')
+    for statement in _DATABASE_SCHEMA:
+        db.execute(statement)
+    db.commit()
+    return db
+
+
+def _close_database():
+    """Close and forget the connection to the crawl database and the link views over it"""
+    global _database, _incoming_links, _outgoing_links
+    if _database is not None:
+        _database.close()
+        if isinstance(_incoming_links, _DatabaseLinks):
+            _incoming_links = None
+        if isinstance(_outgoing_links, _DatabaseLinks):
+            _outgoing_links = None
+    _database = None
+
+
+def _forget_crawl_data():
+    """Close and drop everything loaded or computed from the crawl files, e.g. before they are replaced or deleted"""
+    global _pages_data, _incoming_links, _outgoing_links, _page_rank_cache, _idf_cache, _tf_cache
+    _close_inverted_index()
+    _close_database()
+    _pages_data = None
+    _incoming_links = None
+    _outgoing_links = None
+    _page_rank_cache = None
+    _idf_cache = None
+    _tf_cache = None
+
+
+def _database_page_count(db):
+    """Return the number of pages in a crawl database"""
+    return db.execute('SELECT COALESCE(MAX(doc) + 1, 0) FROM pages').fetchone()[0]
+
+
+class _DatabaseIndex:
+    """Search index over the pages and postings tables of a crawl database"""
+
+    def __init__(self, db):
+        self._db = db
+
+    def url(self, doc):
+        """Return the URL of a document"""
+        return self._db.execute('SELECT u.url FROM pages p JOIN urls u ON u.id = p.url WHERE p.doc = ?',
+                                (doc,)).fetchone()[0]
+
+    def title(self, doc):
+        """Return the title of a document"""
+        return self._db.execute('SELECT title FROM pages WHERE doc = ?', (doc,)).fetchone()[0]
+
+    def length(self, doc):
+        """Return the number of words in a document"""
+        return self._db.execute('SELECT word_count FROM pages WHERE doc = ?', (doc,)).fetchone()[0]
+
+    def matches(self, word):
+        """Yield (doc id, count) for each page containing word, in doc id order"""
+        return self._db.execute('SELECT p.doc, p.count FROM terms t JOIN postings p ON p.term = t.id '
+                                'WHERE t.term = ? ORDER BY p.doc', (word,))
+
+    def __len__(self):
+        return _database_page_count(self._db)
+
+
+class _DatabaseLinks(collections.abc.Mapping):
+    """Read-only URL -> list of URLs mapping over the outgoing or incoming links in a crawl database"""
+
+    def __init__(self, db, outgoing):
+        self._db = db
+        self._outgoing = outgoing
+
+    def __getitem__(self, url):
+        if self._outgoing:
+            row = self._db.execute('SELECT p.doc FROM urls u JOIN pages p ON p.url = u.id WHERE u.url = ?',
+                                   (url,)).fetchone()
+            if row is None:
+                raise KeyError(url)
+            return [target for target, in self._db.execute(
+                'SELECT u.url FROM edges e JOIN urls u ON u.id = e.target WHERE e.source = ? ORDER BY e.position', row)]
+        row = self._db.execute('SELECT id FROM urls WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            raise KeyError(url)
+        # Each linking page once, in crawl order
+        return [source for source, in self._db.execute(
+            'SELECT u.url FROM edges e JOIN pages p ON p.doc = e.source JOIN urls u ON u.id = p.url '
+            'WHERE e.target = ? GROUP BY e.source ORDER BY e.source', row)]
+
+    def __iter__(self):
+        if self._outgoing:
+            return (url for url, in self._db.execute('SELECT u.url FROM pages p JOIN urls u ON u.id = p.url ORDER BY p.doc'))
+        return (url for url, in self._db.execute('SELECT url FROM urls ORDER BY id'))
+
+    def __len__(self):
+        if self._outgoing:
+            return _database_page_count(self._db)
+        return self._db.execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+
+
+class _InvertedIndex:
+    """
+    Builds the search index of a crawl, a page at a time, and saves it in
+    the binary format read by _MappedIndex.
+
+    Pages are numbered in the order they are added, which is the order of
+    the page data, and every URL seen (pages and link targets) gets a URL
+    id. Everything is kept in flat arrays of integers rather than dicts and
+    lists of Python objects, so an index being built during a crawl takes
+    little more memory than the file it is saved to. Also serves searches
+    itself, for crawl data saved without an index.
+    """
+
+    def __init__(self):
+        self._urls = []  # URL id -> URL
+        self._url_ids = {}  # URL -> URL id
+        self._url_docs = array.array('I')  # URL id -> doc id, or _NO_DOC if it was not crawled
+        self._doc_urls = array.array('I')  # doc id -> URL id
+        self._titles = []  # doc id -> title
+        self._lengths = array.array('I')  # doc id -> number of words
+        self._terms = []  # term id, in the order first seen -> term
+        self._term_ids = {}  # term -> term id
+        self._postings = []  # term id -> doc id, count, doc id, count, ...
+        self._term_counts = array.array('I')  # term id, count pairs of each doc in turn
+        self._term_count_ends = array.array('Q', [0])  # doc id -> end of its term counts, after a leading 0
+        self._outgoing = array.array('I')  # URL ids of each doc's outgoing links in turn
+        self._outgoing_ends = array.array('Q', [0])  # doc id -> end of its outgoing links, after a leading 0
+
+    def add(self, url, page):
+        """Add a page, as saved by the crawler, as the next document"""
+        doc = len(self._doc_urls)
+        url_id = self._url_id(url)
+        self._url_docs[url_id] = doc
+        self._doc_urls.append(url_id)
+        self._titles.append(page.get('title', ''))
+        self._lengths.append(page.get('word_count', len(page.get('words', []))))
+        for word, count in _term_counts(page).items():
+            term = self._term_ids.get(word)
+            if term is None:
+                term = self._term_ids[word] = len(self._terms)
+                self._terms.append(word)
+                self._postings.append(array.array('I'))
+            self._postings[term].extend((doc, count))
+            self._term_counts.extend((term, count))
+        self._term_count_ends.append(len(self._term_counts))
+        self._outgoing.extend([self._url_id(link) for link in page.get('outgoing_links', [])])
+        self._outgoing_ends.append(len(self._outgoing))
+
+    def url(self, doc):
+        """Return the URL of a document"""
+        return self._urls[self._doc_urls[doc]]
+
+    def title(self, doc):
+        """Return the title of a document"""
+        return self._titles[doc]
+
+    def length(self, doc):
+        """Return the number of words in a document"""
+        return self._lengths[doc]
+
+    def doc_id(self, url):
+        """Return the doc id of a crawled URL, or None if it was not crawled"""
+        url_id = self._url_ids.get(url)
+        if url_id is None or self._url_docs[url_id] == _NO_DOC:
+            return None
+        return self._url_docs[url_id]
+
+    def page(self, doc):
+        """Return a document as the page data it was added from"""
+        pairs = self._term_counts[self._term_count_ends[doc]:self._term_count_ends[doc + 1]]
+        return {
+            'title': self._titles[doc],
+            'term_counts': {self._terms[term]: count for term, count in zip(pairs[::2], pairs[1::2])},
+            'word_count': self._lengths[doc],
+            'outgoing_links': [self._urls[url_id] for url_id in self._outgoing_ids(doc)]
+        }
+
+    def pages(self):
+        """Return a URL -> page data mapping over the documents, in doc id order"""
+        return _IndexPages(self)
+
+    def incoming_links(self):
+        """
+        Return a URL -> list of incoming URLs mapping over the links of the
+        documents, as the crawler builds it: every link target in the order
+        it was first linked to, then the documents no page links to, each
+        with the distinct documents linking to it in doc id order.
+        """
+        return _IndexIncomingLinks(self)
+
+    def doc_freqs(self):
+        """Return a term -> number of documents containing it dict, in the order the terms were first seen"""
+        return {term: len(postings) // 2 for term, postings in zip(self._terms, self._postings)}
+
+    def matches(self, word):
+        """Yield (doc id, count) for each page containing word, in doc id order"""
+        term = self._term_ids.get(word)
+        if term is None:
+            return iter(())
+        postings = self._postings[term]
+        return zip(postings[::2], postings[1::2])
+
+    def save(self, path, incoming_links=None):
+        """
+        Write the index to a file (see _MappedIndex for the format).
+
+        Args:
+            path (str): File to write; it is replaced atomically
+            incoming_links (dict): URL -> list of incoming URLs mapping to
+                save, or None to save the incoming links implied by the
+                outgoing links of the documents, in doc id order
+        """
+        for url in incoming_links or ():
+            self._url_id(url)
+        num_urls = len(self._urls)
+        num_docs = len(self._doc_urls)
+
+        url_order = array.array('I', sorted(range(num_urls), key=self._urls.__getitem__))
+
+        # Terms are saved in sorted order so they can be binary searched
+        term_order = sorted(range(len(self._terms)), key=self._terms.__getitem__)
+        new_term_ids = array.array('I', [0]) * len(self._terms)
+        for new_id, term in enumerate(term_order):
+            new_term_ids[term] = new_id
+
+        postings = _VarintLists()
+        for term in term_order:
+            docs = self._postings[term]
+            postings.add(_deltas(docs[::2]), docs[1::2])
+
+        term_counts = _VarintLists()
+        for doc in range(num_docs):
+            pairs = self._term_counts[self._term_count_ends[doc]:self._term_count_ends[doc + 1]]
+            counts = sorted(zip([new_term_ids[term] for term in pairs[::2]], pairs[1::2]))
+            term_counts.add(_deltas([term for term, _ in counts]), [count for _, count in counts])
+
+        outgoing = _VarintLists()
+        for doc in range(num_docs):
+            outgoing.add(self._outgoing_ids(doc))
+        incoming_lists = _VarintLists()
+        if incoming_links is None:
+            offsets, sources, _ = self._incoming_ids()
+            for url_id in range(num_urls):
+                incoming_lists.add(sources[offsets[url_id]:offsets[url_id + 1]])
+        else:
+            for url in self._urls:
+                incoming_lists.add([self._url_ids[source] for source in incoming_links.get(url, ())])
+
+        url_offsets, url_strings = _string_table(self._urls)
+        title_offsets, title_strings = _string_table(self._titles)
+        term_offsets, term_strings = _string_table([self._terms[term] for term in term_order])
+        doc_freqs = array.array('I', [len(self._postings[term]) // 2 for term in term_order])
+        sections = {
+            'url_offsets': url_offsets, 'url_strings': url_strings, 'url_order': url_order, 'url_docs': self._url_docs,
+            'doc_urls': self._doc_urls, 'title_offsets': title_offsets, 'title_strings': title_strings,
+            'lengths': self._lengths, 'term_offsets': term_offsets, 'term_strings': term_strings,
+            'doc_freqs': doc_freqs, 'posting_offsets': postings.offsets, 'postings': postings.data,
+            'term_count_offsets': term_counts.offsets, 'term_counts': term_counts.data,
+            'outgoing_offsets': outgoing.offsets, 'outgoing': outgoing.data,
+            'incoming_offsets': incoming_lists.offsets, 'incoming': incoming_lists.data,
+        }
+        _close_inverted_index()
+        _write_index_file(path, [sections[name] for name in _INDEX_SECTIONS])
+
+    def _url_id(self, url):
+        url_id = self._url_ids.get(url)
+        if url_id is None:
+            url_id = self._url_ids[url] = len(self._urls)
+            self._urls.append(url)
+            self._url_docs.append(_NO_DOC)
+        return url_id
+
+    def _outgoing_ids(self, doc):
+        return self._outgoing[self._outgoing_ends[doc]:self._outgoing_ends[doc + 1]]
+
+    def _incoming_ids(self):
+        """
+        Return the incoming links of every URL id as (offsets, sources,
+        targets): the URL ids of the documents linking to URL id u are
+        sources[offsets[u]:offsets[u + 1]], and targets holds the URL ids
+        that are linked to, in the order they were first linked to.
+        """
+        num_urls = len(self._urls)
+        counts = array.array('Q', [0]) * (num_urls + 1)
+        targets = array.array('I')
+        for doc in range(len(self._doc_urls)):
+            for target in dict.fromkeys(self._outgoing_ids(doc)):
+                if not counts[target + 1]:
+                    targets.append(target)
+                counts[target + 1] += 1
+        offsets = array.array('Q', itertools.accumulate(counts))
+
+        # Fill each URL's sources in doc id order
+        ends = array.array('Q', offsets[:-1])
+        sources = array.array('I', [0]) * offsets[-1]
+        for doc, url_id in enumerate(self._doc_urls):
+            for target in dict.fromkeys(self._outgoing_ids(doc)):
+                sources[ends[target]] = url_id
+                ends[target] += 1
+        return offsets, sources, targets
+
+    def __len__(self):
+        return len(self._doc_urls)
+
+
+class _MappedIndex:
+    """
+    Read-only search index over a file written by _InvertedIndex.save,
+    opened with mmap. Opening it reads nothing but the header; everything
+    else is read from the mapped file when asked for, so the operating
+    system only loads the parts of the file that are used.
+
+    The file starts with _INDEX_MAGIC, the number of sections and a table
+    of (offset, length) pairs, one for each section in _INDEX_SECTIONS
+    order. All integers are little-endian and sections start at multiples
+    of 8 bytes. Sections are either
+    - fixed-width arrays of 32-bit (doc ids, URL ids, counts) or 64-bit
+      (offsets) integers, indexed directly, or
+    - blobs of concatenated variable-length items (UTF-8 strings, or lists
+      of LEB128 varints), with an offsets array of one more entry than
+      there are items giving where each item starts and ends.
+
+    URLs, titles and terms are string tables. Terms are stored in sorted
+    order and URLs with a sorted permutation (url_order), so both are
+    found by binary search. Postings are (doc id gap, count) varint pairs
+    per term, doc_freqs the number of postings of each term. term_counts
+    holds each document's (term id gap, count) pairs, outgoing each
+    document's links and incoming each URL's incoming links, as URL ids.
+    url_docs maps URL ids to doc ids, with _NO_DOC for uncrawled URLs.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(_INDEX_MAGIC)] != _INDEX_MAGIC:
+            self._map.close()
+            raise ValueError('%s is not a search index' % path)
+        count, = struct.unpack_from('<I', self._map, len(_INDEX_MAGIC))
+        table = struct.unpack_from('<%dQ' % (2 * count), self._map, len(_INDEX_MAGIC) + 8)
+        self._sections = dict(zip(_INDEX_SECTIONS, zip(table[::2], table[1::2])))
+        self._views = []
+
+        self._url_strings = _StringTable(self._map, self._array('url_offsets', 'Q'), self._sections['url_strings'][0])
+        self._url_order = self._array('url_order', 'I')
+        self._url_docs = self._array('url_docs', 'I')
+        self._doc_urls = self._array('doc_urls', 'I')
+        self._titles = _StringTable(self._map, self._array('title_offsets', 'Q'), self._sections['title_strings'][0])
+        self._lengths = self._array('lengths', 'I')
+        self._terms = _StringTable(self._map, self._array('term_offsets', 'Q'), self._sections['term_strings'][0])
+        self._doc_freqs = self._array('doc_freqs', 'I')
+        self._postings = self._lists('posting_offsets', 'postings')
+        self._term_counts = self._lists('term_count_offsets', 'term_counts')
+        self._outgoing = self._lists('outgoing_offsets', 'outgoing')
+        self._incoming = self._lists('incoming_offsets', 'incoming')
+        self.outgoing_links = _LinkView(self, outgoing=True)
+        self.incoming_links = _LinkView(self, outgoing=False)
+
+    def url(self, doc):
+        """Return the URL of a document"""
+        return self._url_strings[self._doc_urls[doc]]
+
+    def title(self, doc):
+        """Return the title of a document"""
+        return self._titles[doc]
+
+    def length(self, doc):
+        """Return the number of words in a document"""
+        return self._lengths[doc]
+
+    def url_id(self, url):
+        """Return the URL id of a URL, or None if the crawl never saw it"""
+        return _binary_search(self._url_strings, self._url_order, url)
+
+    def doc_id(self, url):
+        """Return the doc id of a crawled URL, or None if it was not crawled"""
+        url_id = self.url_id(url)
+        if url_id is None or self._url_docs[url_id] == _NO_DOC:
+            return None
+        return self._url_docs[url_id]
+
+    def matches(self, word):
+        """Yield (doc id, count) for each page containing word, in doc id order"""
+        term = _binary_search(self._terms, range(len(self._terms)), word)
+        if term is None:
+            return
+        values = self._postings(term)
+        doc = 0
+        for i in range(0, len(values), 2):
+            doc += values[i]
+            yield doc, values[i + 1]
+
+    def term_count(self, doc, word):
+        """Return the number of times word appears in a document"""
+        term = _binary_search(self._terms, range(len(self._terms)), word)
+        if term is None:
+            return 0
+        values = self._term_counts(doc)
+        current = 0
+        for i in range(0, len(values), 2):
+            current += values[i]
+            if current >= term:
+                return values[i + 1] if current == term else 0
+        return 0
+
+    def doc_freq(self, word):
+        """Return the number of documents containing word, or None if no document does"""
+        term = _binary_search(self._terms, range(len(self._terms)), word)
+        return None if term is None else self._doc_freqs[term]
+
+    def doc_freqs(self):
+        """Yield (term, number of documents containing it) for every term"""
+        for term in range(len(self._terms)):
+            yield self._terms[term], self._doc_freqs[term]
+
+    def outgoing(self, doc):
+        """Return the URLs a document links to"""
+        return [self._url_strings[url_id] for url_id in self._outgoing(doc)]
+
+    def incoming(self, url_id):
+        """Return the URLs of the documents linking to a URL"""
+        return [self._url_strings[source] for source in self._incoming(url_id)]
+
+    def close(self):
+        """Unmap the file"""
+        for view in reversed(self._views):  # casts before the views they were made from
+            view.release()
+        self._map.close()
+
+    def _array(self, name, typecode):
+        offset, length = self._sections[name]
+        view = memoryview(self._map)[offset:offset + length]
+        self._views.append(view)
+        values = view.cast(typecode)
+        self._views.append(values)
+        if sys.byteorder == 'big':
+            values = array.array(typecode, values)
+            values.byteswap()
+        return values
+
+    def _lists(self, offsets_name, data_name):
+        """Return a function decoding item i of a section of varint lists"""
+        offsets = self._array(offsets_name, 'Q')
+        base = self._sections[data_name][0]
+        return lambda i: _decode_varints(self._map[base + offsets[i]:base + offsets[i + 1]])
+
+    def __len__(self):
+        return len(self._doc_urls)
+
+
+class _StringTable(collections.abc.Sequence):
+    """Read-only sequence of the UTF-8 strings in a string table section of a mapped file"""
+
+    def __init__(self, data, offsets, base):
+        self._data = data
+        self._offsets = offsets
+        self._base = base
+
+    def raw(self, i):
+        """Return string i undecoded"""
+        return self._data[self._base + self._offsets[i]:self._base + self._offsets[i + 1]]
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError('string table index out of range')
+        return self.raw(i).decode('utf-8')
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+
+class _LinkView(collections.abc.Mapping):
+    """Read-only URL -> list of URLs mapping over the outgoing or incoming links of a _MappedIndex"""
+
+    def __init__(self, index, outgoing):
+        self._index = index
+        self._outgoing = outgoing
+
+    def __getitem__(self, url):
+        if self._outgoing:
+            doc = self._index.doc_id(url)
+            if doc is None:
+                raise KeyError(url)
+            return self._index.outgoing(doc)
+        url_id = self._index.url_id(url)
+        if url_id is None:
+            raise KeyError(url)
+        return self._index.incoming(url_id)
+
+    def __iter__(self):
+        if self._outgoing:
+            return (self._index.url(doc) for doc in range(len(self._index)))
+        return iter(self._index._url_strings)
+
+    def __len__(self):
+        return len(self._index) if self._outgoing else len(self._index._url_strings)
+
+
+class _IndexPages(collections.abc.Mapping):
+    """Read-only URL -> page data mapping over the documents of an _InvertedIndex"""
+
+    def __init__(self, index):
+        self._index = index
+
+    def __getitem__(self, url):
+        doc = self._index.doc_id(url)
+        if doc is None:
+            raise KeyError(url)
+        return self._index.page(doc)
+
+    def __iter__(self):
+        return (self._index.url(doc) for doc in range(len(self._index)))
+
+    def __len__(self):
+        return len(self._index)
+
+
+class _IndexIncomingLinks(collections.abc.Mapping):
+    """Read-only URL -> list of incoming URLs mapping over the links of an _InvertedIndex"""
+
+    def __init__(self, index):
+        self._index = index
+        self._offsets, self._sources, targets = index._incoming_ids()
+        unlinked = [url_id for url_id in index._doc_urls if self._offsets[url_id] == self._offsets[url_id + 1]]
+        self._order = targets + array.array('I', unlinked)
+
+    def __getitem__(self, url):
+        url_id = self._index._url_ids.get(url)
+        if url_id is None or (self._offsets[url_id] == self._offsets[url_id + 1]
+                              and self._index._url_docs[url_id] == _NO_DOC):
+            raise KeyError(url)
+        sources = self._sources[self._offsets[url_id]:self._offsets[url_id + 1]]
+        return [self._index._urls[source] for source in sources]
+
+    def __iter__(self):
+        return (self._index._urls[url_id] for url_id in self._order)
+
+    def __len__(self):
+        return len(self._order)
+
+
+class _VarintLists:
+    """Lists of integers being encoded as a varint blob and its offsets array"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array.array('Q', [0])
+
+    def add(self, values, interleave=None):
+        """Append a list, or the list alternating values and interleave if that is given"""
+        if interleave is not None:
+            values = [value for pair in zip(values, interleave) for value in pair]
+        _encode_varints(values, self.data)
+        self.offsets.append(len(self.data))
+
+
+def _encode_varints(values, out):
+    """Append non-negative integers to a bytearray as LEB128 varints, 7 bits a byte, low bits first"""
+    for value in values:
+        while value >= 0x80:
+            out.append(value & 0x7f | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def _decode_varints(data):
+    """Return the integers in a bytes object of LEB128 varints"""
+    values = []
+    value = shift = 0
+    for byte in data:
+        if byte & 0x80:
+            value |= (byte & 0x7f) << shift
+            shift += 7
+        else:
+            values.append(value | byte << shift)
+            value = shift = 0
+    return values
+
+
+def _deltas(values):
+    """Return the gaps between ascending integers, the first counted from 0"""
+    return [value - previous for previous, value in zip(itertools.chain((0,), values), values)]
+
+
+def _string_table(strings):
+    """Encode strings as a string table: (offsets array, UTF-8 blob)"""
+    data = bytearray()
+    offsets = array.array('Q', [0])
+    for string in strings:
+        data += string.encode('utf-8')
+        offsets.append(len(data))
+    return offsets, data
+
+
+def _binary_search(strings, order, key):
+    """
+    Return the index in a _StringTable of key, whose strings are sorted
+    when taken in the given order (a sequence of indexes), or None if key
+    is not in it.
+    """
+    key = key.encode('utf-8')
+    low, high = 0, len(order)
+    while low < high:
+        middle = (low + high) // 2
+        if strings.raw(order[middle]) < key:
+            low = middle + 1
+        else:
+            high = middle
+    if low < len(order) and strings.raw(order[low]) == key:
+        return order[low]
+    return None
+
+
+def _write_index_file(path, sections):
+    """Write the sections of a search index to path through a temporary file"""
+    header_size = len(_INDEX_MAGIC) + 8 + 16 * len(sections)
+    table = []
+    offset = header_size
+    for data in sections:
+        offset = (offset + 7) // 8 * 8
+        length = len(data) * (data.itemsize if isinstance(data, array.array) else 1)
+        table.append((offset, length))
+        offset += length
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(_INDEX_MAGIC + struct.pack('<II', len(sections), 0))
+        f.write(struct.pack('<%dQ' % (2 * len(table)), *itertools.chain.from_iterable(table)))
+        for (offset, _), data in zip(table, sections):
+            f.write(b'\0' * (offset - f.tell()))
+            if isinstance(data, array.array) and sys.byteorder == 'big':
+                data = array.array(data.typecode, data)
+                data.byteswap()
+            f.write(data)
+    os.replace(temp_path, path)
+
+
+class _JsonLinesPages(collections.abc.Mapping):
+    """
+    Read-only URL -> page data mapping over the JSON Lines file written by
+    crawler.crawl(seed, output='jsonl').
+
+    The first access scans the file once to note where each page record
+    starts; page records are then read and parsed only when asked for, so
+    the corpus never has to be held in memory.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._offsets = None  # URL -> byte offset of its page record
+        self._file = None
+        self._read_record = functools.lru_cache(maxsize=256)(self._read_record)
+
+    def _index(self):
+        if self._offsets is None:
+            self._offsets = {}
+            with open(self._path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    url = _jsonl_page_url(line)
+                    if url is not None:
+                        self._offsets[url] = offset
+                    offset += len(line)
+        return self._offsets
+
+    def _read_record(self, offset):
+        if self._file is None:
+            self._file = open(self._path, 'rb')
+        self._file.seek(offset)
+        record = json.loads(self._file.readline())
+        del record['type'], record['url']
+        return record
+
+    def __getitem__(self, url):
+        return self._read_record(self._index()[url])
+
+    def __contains__(self, url):
+        return url in self._index()
+
+    def __iter__(self):
+        return iter(self._index())
+
+    def __len__(self):
+        return len(self._index())
+
+
+class _FieldView(collections.abc.Mapping):
+    """Read-only URL -> value mapping for one field of each page in a pages mapping"""
+
+    def __init__(self, pages, field):
+        self._pages = pages
+        self._field = field
+
+    def __getitem__(self, url):
+        return self._pages[url][self._field]
+
+    def __contains__(self, url):
+        return url in self._pages
+
+    def __iter__(self):
+        return iter(self._pages)
+
+    def __len__(self):
+        return len(self._pages)
+
+
+def _load_jsonl_incoming_links(path):
+    """
+    Build the URL -> incoming URLs mapping from the link records of a
+    streamed crawl. Every crawled page gets an entry, even with no links in.
+    """
+    incoming_links = {}
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'{"type": "link"'):
+                edge = json.loads(line)
+                incoming_links.setdefault(edge['to'], []).append(edge['from'])
+            else:
+                url = _jsonl_page_url(line)
+                if url is not None:
+                    incoming_links.setdefault(url, [])
+    return incoming_links
+
+
+def _jsonl_page_url(line):
+    """
+    Return the URL of a JSON Lines page record, decoding only the URL and
+    not the rest of the record. Returns None for any other kind of line.
+    """
+    if not line.startswith(_JSONL_PAGE_PREFIX):
+        return None
+    return json.JSONDecoder().raw_decode(line.decode('utf-8'), len(_JSONL_PAGE_PREFIX))[0]
+
+
 def get_outgoing_links(URL):
     """
     Returns a list of URLs that the page with the given URL links to.
@@ -79,6 +948,19 @@ def get_page_rank(URL):
     Returns:
         float: PageRank value or -1 if not found
     """
+    db = _load_database()
+    if db is not None:
+        return _database_page_rank(db, URL)
+
+    index = _load_saved_index()
+    if index is not None:
+        return _saved_page_rank(index, URL)
+
+    return _load_page_ranks().get(URL, -1)
+
+
+def _load_page_ranks():
+    """Load the URL -> PageRank mapping from page_rank.json, computing and saving it first if needed"""
     global _page_rank_cache
 
     # Load cached PageRank data if available
@@ -93,53 +975,164 @@ def get_page_rank(URL):
             with open('page_rank.json', 'w') as f:
                 json.dump(_page_rank_cache, f)
 
-    return _page_rank_cache.get(URL, -1)
+    return _page_rank_cache
+
 
+def _saved_page_rank(index, URL):
+    """Return the PageRank of URL from PAGE_RANK_FILE, or -1 if it was not crawled"""
+    doc = index.doc_id(URL)
+    if doc is None:
+        return -1
+    return _load_saved_page_ranks(index)[doc]
 
-def _compute_page_ranks():
+
+def _doc_page_rank(index, doc):
+    """
+    Return the PageRank of a document of the index returned by
+    _load_inverted_index, as get_page_rank(index.url(doc)) would. With a
+    saved index it is read straight from PAGE_RANK_FILE by doc id, so the
+    URL is never decoded or looked up.
+    """
+    if isinstance(index, _MappedIndex):
+        return _load_saved_page_ranks(index)[doc]
+    return get_page_rank(index.url(doc))
+
+
+def _load_saved_page_ranks(index):
+    """
+    Return the PageRank of each document of a saved index, mapped from
+    PAGE_RANK_FILE. The file is written from page_rank.json (or freshly
+    computed ranks) the first time it is needed, and stays mapped until
+    the index is closed.
+    """
+    global _saved_page_ranks
+    if _saved_page_ranks is None:
+        if not os.path.exists(PAGE_RANK_FILE) or os.path.getsize(PAGE_RANK_FILE) != 8 * len(index):
+            _save_page_ranks(index, _load_page_ranks())
+        _saved_page_ranks = _MappedPageRanks(PAGE_RANK_FILE)
+    return _saved_page_ranks
+
+
+def _save_page_ranks(index, page_ranks):
+    """Write PAGE_RANK_FILE from a URL -> PageRank mapping, replacing it atomically"""
+    values = array.array('d', [page_ranks[index.url(doc)] for doc in range(len(index))])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    with open(PAGE_RANK_FILE + '.tmp', 'wb') as f:
+        values.tofile(f)
+    os.replace(PAGE_RANK_FILE + '.tmp', PAGE_RANK_FILE)
+
+
+class _MappedPageRanks:
+    """Read-only doc id -> PageRank sequence over PAGE_RANK_FILE, opened with mmap"""
+
+    def __init__(self, path):
+        self._map = None
+        self._views = []
+        self._values = array.array('d')
+        if os.path.getsize(path):  # an empty file cannot be mapped
+            with open(path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(self._map)
+            self._values = view.cast('d')
+            self._views = [view, self._values]
+            if sys.byteorder == 'big':
+                self._values = array.array('d', self._values)
+                self._values.byteswap()
+
+    def __getitem__(self, doc):
+        return self._values[doc]
+
+    def __len__(self):
+        return len(self._values)
+
+    def close(self):
+        """Unmap the file"""
+        for view in reversed(self._views):
+            view.release()
+        if self._map is not None:
+            self._map.close()
+
+
+def _database_page_rank(db, URL):
+    """
+    Return the PageRank of URL from the metrics table of a crawl database,
+    or -1 if it was not crawled. PageRank is computed for every page and
+    saved the first time it is asked for.
+    """
+    if db.execute("SELECT 1 FROM metrics WHERE name = 'page_rank' LIMIT 1").fetchone() is None:
+        page_ranks = _compute_page_ranks()
+        with db:
+            db.executemany("INSERT OR REPLACE INTO metrics (name, key, value) "
+                           "SELECT 'page_rank', p.doc, ? FROM urls u JOIN pages p ON p.url = u.id WHERE u.url = ?",
+                           ((rank, url) for url, rank in page_ranks.items()))
+
+    row = db.execute("SELECT m.value FROM urls u JOIN pages p ON p.url = u.id "
+                     "JOIN metrics m ON m.name = 'page_rank' AND m.key = p.doc WHERE u.url = ?", (URL,)).fetchone()
+    return row[0] if row is not None else -1
+
+
+def _compute_page_ranks(initial=None):
     """
     Compute PageRank for all pages using the PageRank algorithm.
     Uses alpha=0.1 and stops when Euclidean distance < 0.0001.
 
+    Args:
+        initial (dict): Optional URL -> PageRank values to start iterating
+            from, e.g. the ranks from before a recrawl; this converges in
+            far fewer iterations than a uniform start when little changed
+
     Returns:
         dict: URL -> PageRank value mapping
     """
-    pages_data = _load_pages_data()
-    outgoing_links = _load_outgoing_links()
-
-    if not pages_data:
+    urls = _crawled_urls()
+    if not urls:
         return {}
-
-    # Create URL to index mapping for matrix operations
-    urls = list(pages_data.keys())
-    url_to_idx = {url: i for i, url in enumerate(urls)}
     n = len(urls)
 
-    # Build adjacency matrix (transition matrix)
-    # M[i][j] = 1/outdegree(i) if i links to j, else 0
-    M = [[0.0 for _ in range(n)] for _ in range(n)]
-
-    for i, url_i in enumerate(urls):
-        out_links = outgoing_links.get(url_i, [])
-        out_degree = len(out_links)
-
-        if out_degree == 0:
-            # Dangling node - distribute equally to all pages
-            for j in range(n):
-                M[j][i] = 1.0 / n
-        else:
-            for url_j in out_links:
-                if url_j in url_to_idx:
-                    j = url_to_idx[url_j]
-                    M[j][i] = 1.0 / out_degree
+    # The transition matrix M has M[j][i] = 1/outdegree(i) if i links to
+    # j, and 1/n for every j if i has no links (a dangling node). It is
+    # kept sparse: sources[offsets[j]:offsets[j + 1]] are the doc ids
+    # linking to j and weights[i] is column i's value. The dangling
+    # columns are the same in every row, so they are left out of sources
+    # and their share is added to each row as one sum
+    weights = array.array('d', [0.0]) * n
+    dangling = array.array('I')
+    edge_sources = array.array('I')
+    edge_targets = array.array('I')
+    for i, targets in enumerate(_link_targets(urls)):
+        if not targets:
+            dangling.append(i)
+            weights[i] = 1.0 / n
+            continue
+        weights[i] = 1.0 / len(targets)
+        for j in dict.fromkeys(targets):
+            if j is not None:
+                edge_sources.append(i)
+                edge_targets.append(j)
+    offsets = array.array('Q', [0]) * (n + 1)
+    for j in edge_targets:
+        offsets[j + 1] += 1
+    offsets = array.array('Q', itertools.accumulate(offsets))
+    ends = array.array('Q', offsets[:-1])
+    sources = array.array('I', [0]) * len(edge_sources)
+    for i, j in zip(edge_sources, edge_targets):
+        sources[ends[j]] = i
+        ends[j] += 1
+    del edge_sources, edge_targets, ends
 
     # PageRank parameters
     alpha = 0.1
     epsilon = 0.0001
 
-    # Initialize PageRank vector (equal probability for all pages)
-    pr_old = [1.0 / n] * n
-    pr_new = [0.0] * n
+    # Initialize PageRank vector (equal probability for all pages, or the
+    # given starting ranks with new pages at 1/n, rescaled to sum to 1)
+    pr_old = array.array('d', [1.0 / n]) * n
+    if initial:
+        pr_old = array.array('d', [initial.get(url, 1.0 / n) for url in urls])
+        total = sum(pr_old)
+        pr_old = array.array('d', [value / total for value in pr_old])
+    pr_new = array.array('d', [0.0]) * n
 
     # Iterate until convergence
     while True:
@@ -147,11 +1140,15 @@ def _compute_page_ranks():
         # This is equivalent to: pr_new = alpha/n + (1-alpha) * M * pr_old
 
         # Compute M * pr_old
-        m_pr = matmult.matvecmult(M, pr_old)
+        contributions = [weights[i] * pr_old[i] for i in range(n)]
+        dangling_pr = sum(contributions[i] for i in dangling)
+        for j in range(n):
+            m_pr = dangling_pr
+            for i in sources[offsets[j]:offsets[j + 1]]:
+                m_pr += contributions[i]
 
-        # Apply PageRank formula
-        for i in range(n):
-            pr_new[i] = alpha / n + (1 - alpha) * m_pr[i]
+            # Apply PageRank formula
+            pr_new[j] = alpha / n + (1 - alpha) * m_pr
 
         # Check convergence (Euclidean distance)
         diff_sum = sum((pr_new[i] - pr_old[i]) ** 2 for i in range(n))
@@ -167,6 +1164,26 @@ def _compute_page_ranks():
     return {urls[i]: pr_new[i] for i in range(n)}
 
 
+def _link_targets(urls):
+    """
+    Yield the outgoing links of each crawled page, in crawl order, as the
+    doc ids (positions in urls) they link to, with None for links to pages
+    that were not crawled.
+    """
+    index = _load_saved_index()
+    if index is not None and _load_database() is None:
+        # Translate the index's URL ids without decoding any URLs
+        for doc in range(len(index)):
+            yield [None if index._url_docs[url_id] == _NO_DOC else index._url_docs[url_id]
+                   for url_id in index._outgoing(doc)]
+        return
+
+    url_to_idx = {url: i for i, url in enumerate(urls)}
+    outgoing_links = _load_outgoing_links()
+    for url in urls:
+        yield [url_to_idx.get(link) for link in outgoing_links.get(url, [])]
+
+
 def get_idf(word):
     """
     Returns the inverse document frequency of the word.
@@ -180,6 +1197,21 @@ def get_idf(word):
     """
     global _idf_cache
 
+    db = _load_database()
+    if db is not None:
+        row = db.execute('SELECT doc_freq FROM terms WHERE term = ?', (word,)).fetchone()
+        if row is None:
+            return 0.0
+        return _idf_from_doc_freq({word: row[0]}, _database_page_count(db))[word]
+
+    # The search index has every term's document frequency, found by binary search
+    index = _load_saved_index()
+    if index is not None:
+        doc_freq = index.doc_freq(word)
+        if doc_freq is None:
+            return 0.0
+        return _idf_from_doc_freq({word: doc_freq}, len(index))[word]
+
     # Load cached IDF data if available
     if _idf_cache is None:
         if os.path.exists('idf_data.json'):
@@ -198,27 +1230,47 @@ def get_idf(word):
 def _compute_idf_values():
     """
     Compute IDF values for all words in the corpus.
+    Uses the document frequencies saved by the crawler when available.
 
     Returns:
         dict: word -> IDF value mapping
     """
-    pages_data = _load_pages_data()
+    index = _load_saved_index()
+    pages_data = _load_pages_data() if index is None else None
 
-    if not pages_data:
+    # Count total documents and documents containing each word
+    total_docs = len(index) if index is not None else len(pages_data)
+
+    if not total_docs:
         return {}
 
-    # Count total documents and documents containing each word
-    total_docs = len(pages_data)
+    if os.path.exists('doc_freq.json'):
+        with open('doc_freq.json', 'r') as f:
+            return _idf_from_doc_freq(json.load(f), total_docs)
+
+    if index is not None:
+        return _idf_from_doc_freq(dict(index.doc_freqs()), total_docs)
+
     word_doc_count = {}
 
     for url, data in pages_data.items():
-        words = data.get('words', [])
-        unique_words = set(words)  # Only count once per document
-
-        for word in unique_words:
+        for word in _term_counts(data):  # Only count once per document
             word_doc_count[word] = word_doc_count.get(word, 0) + 1
 
-    # Compute IDF for each word
+    return _idf_from_doc_freq(word_doc_count, total_docs)
+
+
+def _idf_from_doc_freq(word_doc_count, total_docs):
+    """
+    Compute IDF values from document frequencies.
+
+    Args:
+        word_doc_count (dict): word -> number of documents containing it
+        total_docs (int): Total number of documents
+
+    Returns:
+        dict: word -> IDF value mapping
+    """
     idf_values = {}
     for word, doc_count in word_doc_count.items():
         idf = math.log(total_docs / (1 + doc_count), 2)  # log base 2
@@ -227,11 +1279,51 @@ def _compute_idf_values():
     return idf_values
 
 
+def _update_derived_data(links_changed):
+    """
+    Bring saved IDF and PageRank values up to date after crawler.recrawl
+    has rewritten the crawl files.
+
+    IDF is recomputed from the saved document frequencies, without a pass
+    over the pages. PageRank is only recomputed if the link graph changed,
+    starting from the previous ranks. Values that were never computed are
+    left to be computed on demand.
+
+    Args:
+        links_changed (bool): Whether any outgoing links changed
+    """
+    global _page_rank_cache, _idf_cache
+
+    # Drop anything loaded from the old crawl files
+    _forget_crawl_data()
+
+    if os.path.exists('idf_data.json'):
+        # Recompute from doc_freq.json and save
+        _idf_cache = _compute_idf_values()
+        with open('idf_data.json', 'w') as f:
+            json.dump(_idf_cache, f)
+
+    # Doc ids may have changed; it is rewritten from page_rank.json when next needed
+    if os.path.exists(PAGE_RANK_FILE):
+        os.remove(PAGE_RANK_FILE)
+
+    if links_changed and os.path.exists('page_rank.json'):
+        with open('page_rank.json', 'r') as f:
+            previous_ranks = json.load(f)
+        _page_rank_cache = _compute_page_ranks(previous_ranks)
+        with open('page_rank.json', 'w') as f:
+            json.dump(_page_rank_cache, f)
+
+
 def get_tf(URL, word):
     """
     Returns the term frequency of the word in the given URL.
     TF = # occurrences of word in document / total # words in document
 
+    Uses the term counts stored by the crawler: one indexed read from the
+    crawl database, a lookup of the page's entry in the search index, or
+    a dictionary lookup in the page data.
+
     Args:
         URL (str): The URL of the document
         word (str): The word to get TF for
@@ -239,19 +1331,48 @@ def get_tf(URL, word):
     Returns:
         float: TF value or 0 if word not in document or URL not found
     """
+    db = _load_database()
+    if db is not None:
+        row = db.execute('SELECT p.word_count, (SELECT count FROM postings WHERE term = '
+                         '(SELECT id FROM terms WHERE term = ?) AND doc = p.doc) '
+                         'FROM urls u JOIN pages p ON p.url = u.id WHERE u.url = ?', (word, URL)).fetchone()
+        if row is None or not row[0]:
+            return 0.0
+        return (row[1] or 0) / row[0]
+
+    index = _load_saved_index()
+    if index is not None:
+        doc = index.doc_id(URL)
+        if doc is None or not index.length(doc):
+            return 0.0
+        return index.term_count(doc, word) / index.length(doc)
+
     pages_data = _load_pages_data()
 
     if URL not in pages_data:
         return 0.0
 
-    words = pages_data[URL].get('words', [])
-    if not words:
+    page = pages_data[URL]
+    term_counts = _term_counts(page)
+    total_words = page.get('word_count', len(page.get('words', [])))
+    if not total_words:
         return 0.0
 
-    word_count = words.count(word)
-    total_words = len(words)
+    return term_counts.get(word, 0) / total_words
+
+
+def _term_counts(page):
+    """
+    Returns the word -> count mapping of a page.
+    Crawl data saved before term counts were stored has only the word list.
+    """
+    if 'term_counts' in page:
+        return page['term_counts']
 
-    return word_count / total_words
+    term_counts = {}
+    for word in page.get('words', []):
+        term_counts[word] = term_counts.get(word, 0) + 1
+    return term_counts
 
 
 def get_tf_idf(URL, word):
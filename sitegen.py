@@ -0,0 +1,278 @@
+import os
+import sys
+import gzip
+import time
+import random
+import argparse
+import bisect
+import functools
+import itertools
+import threading
+import http.server
+
+# Words used by the fruits sites
+FRUITS = ['apple', 'banana', 'coconut', 'kiwi', 'peach', 'pear', 'fig', 'lime', 'cherry', 'papaya',
+          'blueberry', 'apricot', 'tomato']
+
+
+class SyntheticSite:
+    """
+    A fruits-style site of num_pages pages named N-0.html ... N-<num_pages-1>.html.
+
+    Each page has a <title>, one or more <p> blocks of words and a list of
+    ./N-i.html links, like the tinyfruits and fruits sites. Pages are
+    generated on demand from (seed, page number), so a site of millions
+    of pages costs no memory and every page is the same each time it is
+    generated. Page i always links to page i+1, so every page is reachable
+    from N-0.html.
+
+    Link degree: each page has between min_links and max_links links,
+    where 1 <= min_links <= max_links. With link_degree='uniform' every
+    count is equally likely; with 'zipf' the count follows a power law,
+    so most pages have few links and a few pages have many.
+
+    Link targets: with link_targets='uniform' every page is equally
+    likely to be linked to; with 'zipf' low-numbered pages are linked to
+    far more often, giving the skewed in-degrees PageRank is meant for.
+
+    Vocabulary: words are drawn from vocabulary (FRUITS by default),
+    extended with numbered variants (apple1, banana1, ...) up to
+    vocab_size words. With word_distribution='zipf' the i-th word is
+    drawn with weight 1 / i**zipf_exponent; with 'uniform' all words are
+    equally likely.
+    """
+
+    def __init__(self, num_pages, min_links=1, max_links=10, link_degree='uniform', link_targets='uniform',
+                 min_words=5, max_words=60, vocabulary=FRUITS, vocab_size=None, word_distribution='uniform',
+                 zipf_exponent=1.0, seed=1405):
+        for name, value in (('link_degree', link_degree), ('link_targets', link_targets),
+                            ('word_distribution', word_distribution)):
+            if value not in ('uniform', 'zipf'):
+                raise ValueError("%s must be 'uniform' or 'zipf', not %r" % (name, value))
+        if not 1 <= min_links <= max_links:
+            # Every page links to the next one, so it has at least one link
+            raise ValueError('need 1 <= min_links <= max_links, not min_links=%r, max_links=%r'
+                             % (min_links, max_links))
+
+        self.num_pages = num_pages
+        self.min_links = min_links
+        self.max_links = max_links
+        self.link_degree = link_degree
+        self.link_targets = link_targets
+        self.min_words = min_words
+        self.max_words = max_words
+        self.seed = seed
+
+        # Extend the vocabulary with numbered variants of its words
+        vocab_size = vocab_size or len(vocabulary)
+        self.vocabulary = list(itertools.islice(
+            itertools.chain(vocabulary, ('%s%d' % (word, n) for n in itertools.count(1) for word in vocabulary)),
+            vocab_size))
+
+        # Cumulative word weights for random.choices
+        if word_distribution == 'zipf':
+            weights = [1 / (rank ** zipf_exponent) for rank in range(1, vocab_size + 1)]
+        else:
+            weights = [1] * vocab_size
+        self._word_weights = list(itertools.accumulate(weights))
+        # Cumulative link count weights for 'zipf' link degrees
+        if link_degree == 'zipf':
+            self._link_weights = list(itertools.accumulate(1 / k for k in range(min_links, max_links + 1)))
+
+    def page_name(self, page):
+        """Return the file name of page number page"""
+        return 'N-%d.html' % page
+
+    def page_number(self, name):
+        """Return the page number for a file name, or None if it is not a page of this site"""
+        if not (name.startswith('N-') and name.endswith('.html')):
+            return None
+        number = name[2:-5]
+        if not number.isdigit() or int(number) >= self.num_pages or str(int(number)) != number:
+            return None
+        return int(number)
+
+    def page_words(self, page):
+        """Return the words on a page, in order"""
+        rng = random.Random(self.seed * 1000003 + page)
+        count = rng.randint(self.min_words, self.max_words)
+        return rng.choices(self.vocabulary, cum_weights=self._word_weights, k=count)
+
+    def page_links(self, page):
+        """Return the distinct page numbers a page links to, in link order"""
+        rng = random.Random(self.seed * 7919 + page)
+        if self.link_degree == 'zipf':
+            degree = self.min_links + bisect.bisect(self._link_weights, rng.random() * self._link_weights[-1])
+        else:
+            degree = rng.randint(self.min_links, self.max_links)
+
+        links = {(page + 1) % self.num_pages: None}
+        for _ in range(degree - 1):
+            if self.link_targets == 'zipf':
+                # Log-uniform rank: page k is linked to with probability ~ 1/(k+1)
+                target = int(self.num_pages ** rng.random()) - 1
+            else:
+                target = rng.randrange(self.num_pages)
+            links[target] = None
+        return list(links)
+
+    def render(self, page):
+        """Return the HTML of a page"""
+        words = self.page_words(page)
+        parts = ['<html>\n<head><title>N-%d</title>\n</head>\n<body>\n' % page]
+        # Split the words over a few paragraphs, as the larger fruits sites do
+        for start in range(0, len(words), 40):
+            parts.append('<p>\n%s\n</p>\n' % '\n'.join(words[start:start + 40]))
+        for target in self.page_links(page):
+            name = self.page_name(target)
+            parts.append('<a href="./%s">%s</a>\n' % (name, name[:-5]))
+        parts.append('</body>\n</html>\n')
+        return ''.join(parts)
+
+    def get(self, name, default=None):
+        """Return the HTML of the page with the given file name, or default if there is none"""
+        page = self.page_number(name)
+        if page is None:
+            return default
+        return self.render(page)
+
+    def write(self, directory):
+        """Write every page of the site to directory as N-i.html files"""
+        os.makedirs(directory, exist_ok=True)
+        for page in range(self.num_pages):
+            with open(os.path.join(directory, self.page_name(page)), 'w') as f:
+                f.write(self.render(page))
+
+    def __len__(self):
+        return self.num_pages
+
+
+class _SiteHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the pages of a SiteServer over HTTP/1.1 keep-alive"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def do_GET(self):
+        name = self.path.lstrip('/')
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+        body = self.server.site_server.page_body(name, gzipped)
+        if body is None:
+            self.send_error(404)
+            return
+        if self.server.site_server.delay:
+            time.sleep(self.server.site_server.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SiteServer:
+    """
+    A threaded HTTP server on localhost serving a site in a background thread.
+
+    site is anything with a get(name) method returning a page's HTML (or
+    None): a SyntheticSite, or a plain dict of name -> HTML. Pages are
+    gzip-compressed for clients that accept it. The listen backlog is
+    raised and Nagle's algorithm is off, so many concurrent keep-alive
+    clients are not held up by the server.
+
+    Can be used as a context manager:
+
+        with SiteServer(SyntheticSite(100000)) as server:
+            crawler.crawl(server.seed_url, max_workers=16)
+    """
+
+    def __init__(self, site, port=0, delay=0.0, cache_size=4096):
+        """
+        Args:
+            site: The pages to serve, by file name
+            port (int): Port to listen on, or 0 for any free port
+            delay (float): Seconds to wait before answering each request,
+                to simulate a slow server
+            cache_size (int): Number of encoded pages kept in memory
+        """
+        self.site = site
+        self.delay = delay
+        self.page_body = functools.lru_cache(maxsize=cache_size)(self._encode)
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port), _SiteHandler, bind_and_activate=False)
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 1024
+        self.server.site_server = self
+        self.server.server_bind()
+        self.server.server_activate()
+        self.base_url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        self.seed_url = self.base_url + 'N-0.html'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _encode(self, name, gzipped):
+        """Return the response body for a page, or None if there is no such page"""
+        html = self.site.get(name)
+        if html is None:
+            return None
+        body = html.encode('utf-8')
+        return gzip.compress(body, compresslevel=6) if gzipped else body
+
+    def close(self):
+        """Stop the server"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _site_from_args(args):
+    """Create the SyntheticSite described by parsed command line arguments"""
+    return SyntheticSite(args.pages, min_links=args.min_links, max_links=args.max_links,
+                         link_degree=args.link_degree, link_targets=args.link_targets,
+                         min_words=args.min_words, max_words=args.max_words, vocab_size=args.vocab_size,
+                         word_distribution=args.word_distribution, zipf_exponent=args.zipf_exponent,
+                         seed=args.seed)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Generate and serve synthetic fruits-style sites')
+    parser.add_argument('command', choices=['serve', 'write'], help='serve the site over HTTP, or write it to a directory')
+    parser.add_argument('pages', type=int, help='number of pages')
+    parser.add_argument('--directory', default='synthetic_site', help='where write puts the pages')
+    parser.add_argument('--port', type=int, default=8000, help='port serve listens on')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds serve waits before each response')
+    parser.add_argument('--min-links', type=int, default=1)
+    parser.add_argument('--max-links', type=int, default=10)
+    parser.add_argument('--link-degree', choices=['uniform', 'zipf'], default='uniform')
+    parser.add_argument('--link-targets', choices=['uniform', 'zipf'], default='uniform')
+    parser.add_argument('--min-words', type=int, default=5)
+    parser.add_argument('--max-words', type=int, default=60)
+    parser.add_argument('--vocab-size', type=int, default=None)
+    parser.add_argument('--word-distribution', choices=['uniform', 'zipf'], default='uniform')
+    parser.add_argument('--zipf-exponent', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=1405)
+    args = parser.parse_args(argv)
+
+    site = _site_from_args(args)
+    if args.command == 'write':
+        site.write(args.directory)
+        print('wrote %d pages to %s' % (len(site), args.directory))
+        return
+
+    server = SiteServer(site, port=args.port, delay=args.delay)
+    print('serving %d pages, seed URL %s' % (len(site), server.seed_url))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import testingtools
+import crawler
+import searchdata
+import sitegen
+output = open(os.path.abspath('synthetic-index-failed.txt'), 'w')
+success_output = open(os.path.abspath('synthetic-index-passed.txt'), 'w')
+
+#A local synthetic site with a large, skewed vocabulary is crawled with each output format, and what searchdata
+#and search give is checked against the JSON crawl, before and after reopening the saved files
+site = sitegen.SyntheticSite(400, min_links=2, max_links=10, link_targets='zipf', vocab_size=500, word_distribution='zipf', seed=4)
+server = sitegen.SiteServer(site)
+urls = [server.base_url + site.page_name(page) for page in range(len(site))] + [server.base_url + 'missing.html']
+words = ['apple', 'kiwi', 'tomato', 'apple3', 'cherry12', 'tomato37', 'durian']
+queries = ['apple', 'kiwi banana kiwi', 'apple3 cherry12', 'tomato37 durian']
+
+#Performing a crawl with output='json', which also saves the binary search index
+os.chdir(tempfile.mkdtemp())
+crawler.crawl(server.seed_url, max_workers=4)
+expected = testingtools.crawl_snapshot(urls, words, queries)
+test = testingtools.write_test(output, success_output, 0, 'that the binary search index is saved', True,
+                               os.path.exists(searchdata.INDEX_FILE), os.path.exists(searchdata.INDEX_FILE))
+
+#Reopening the search index and the page ranks saved with it
+searchdata._forget_crawl_data()
+test = testingtools.write_test(output, success_output, test, 'that the page ranks are saved with the search index', True,
+                               os.path.exists(searchdata.PAGE_RANK_FILE), os.path.exists(searchdata.PAGE_RANK_FILE))
+test = testingtools.write_snapshot_tests(output, success_output, test, 'after reopening the binary search index', expected,
+                                         testingtools.crawl_snapshot(urls, words, queries))
+
+#Without the binary files searchdata reads the JSON files, as for crawl data saved before there was an index
+searchdata._forget_crawl_data()
+os.remove(searchdata.INDEX_FILE)
+os.remove(searchdata.PAGE_RANK_FILE)
+test = testingtools.write_snapshot_tests(output, success_output, test, 'from the JSON files alone', expected,
+                                         testingtools.crawl_snapshot(urls, words, queries))
+
+for output_format in ['jsonl', 'sqlite']:
+  os.chdir(tempfile.mkdtemp())
+  crawler.crawl(server.seed_url, max_workers=4, output=output_format)
+  test = testingtools.write_snapshot_tests(output, success_output, test, 'after a crawl with output=' + output_format, expected,
+                                           testingtools.crawl_snapshot(urls, words, queries))
+  searchdata._forget_crawl_data()
+  test = testingtools.write_snapshot_tests(output, success_output, test, 'after reopening the crawl data saved with output=' + output_format, expected,
+                                           testingtools.crawl_snapshot(urls, words, queries))
+
+server.close()
+output.close()
+success_output.close()
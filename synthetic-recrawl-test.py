@@ -0,0 +1,93 @@
+import os
+import tempfile
+import testingtools
+import crawler
+import sitegen
+output = open(os.path.abspath('synthetic-recrawl-failed.txt'), 'w')
+success_output = open(os.path.abspath('synthetic-recrawl-passed.txt'), 'w')
+
+#A local synthetic site is crawled, changed and recrawled, and the recrawled data is checked against
+#a fresh crawl of the changed site; the pages are kept in a dict so they can be changed while being served
+site = sitegen.SyntheticSite(200, min_links=2, max_links=8, seed=3)
+pages = {site.page_name(page): site.render(page) for page in range(len(site))}
+server = sitegen.SiteServer(pages, cache_size=0)
+words = sitegen.FRUITS[:6] + ['tomato']
+queries = ['apple', 'kiwi banana kiwi', 'tomato pear']
+
+def urls():
+  return [server.base_url + name for name in sorted(pages)] + [server.base_url + 'N-50.html']
+
+real_parse_and_resolve = crawler._parse_and_resolve
+parsed = []
+
+#records the pages parsed by the crawler
+def counting_parse_and_resolve(current_url, *args, **kwargs):
+  parsed.append(current_url)
+  return real_parse_and_resolve(current_url, *args, **kwargs)
+
+crawler._parse_and_resolve = counting_parse_and_resolve
+
+def fresh_crawl_snapshot():
+  os.chdir(tempfile.mkdtemp())
+  crawler.crawl(server.seed_url, max_workers=4)
+  return testingtools.crawl_snapshot(urls(), words, queries)
+
+#Performing a crawl, then a recrawl of the unchanged site, which saves the content hashes later recrawls compare against
+recrawl_directory = tempfile.mkdtemp()
+os.chdir(recrawl_directory)
+crawler.crawl(server.seed_url, max_workers=4)
+testingtools.crawl_snapshot(urls(), words, queries)
+crawler.recrawl(server.seed_url, max_workers=4)
+result = testingtools.crawl_snapshot(urls(), words, queries)
+test = testingtools.write_snapshot_tests(output, success_output, 0, 'after recrawling an unchanged site', fresh_crawl_snapshot(), result)
+
+#Changing some words, adding a page, removing a link and deleting a page
+pages['N-3.html'] = pages['N-3.html'].replace('<p>\n', '<p>\ntomato\ntomato\n', 1)
+pages['N-7.html'] = pages['N-7.html'].replace('<p>\n', '<p>\nkiwi\n', 1)
+pages['N-10.html'] = pages['N-10.html'].replace('</body>', '<a href="./N-200.html">N-200</a>\n</body>')
+pages['N-200.html'] = '<html>\n<head><title>N-200</title>\n</head>\n<body>\n<p>\ntomato\napple\n</p>\n<a href="./N-0.html">N-0</a>\n</body>\n</html>\n'
+link = '<a href="./N-%d.html">N-%d</a>\n' % (site.page_links(11)[-1], site.page_links(11)[-1])
+pages['N-11.html'] = pages['N-11.html'].replace(link, '', 1)
+del pages['N-50.html']
+changed = sorted(server.base_url + name for name in ['N-3.html', 'N-7.html', 'N-10.html', 'N-11.html', 'N-200.html'])
+
+os.chdir(recrawl_directory)
+parsed.clear()
+result_pages = crawler.recrawl(server.seed_url, max_workers=4)
+result_parsed = sorted(parsed)
+result = testingtools.crawl_snapshot(urls(), words, queries)
+expected = fresh_crawl_snapshot()
+test = testingtools.write_test(output, success_output, test, 'number of pages after recrawling a changed site', len(expected['crawled pages']['all']), result_pages,
+                               result_pages == len(expected['crawled pages']['all']))
+test = testingtools.write_test(output, success_output, test, 'pages parsed when recrawling a changed site', changed, result_parsed, result_parsed == changed)
+test = testingtools.write_snapshot_tests(output, success_output, test, 'after recrawling a changed site', expected, result)
+
+#Recrawling again without changes parses no pages
+os.chdir(recrawl_directory)
+parsed.clear()
+crawler.recrawl(server.seed_url, max_workers=4)
+test = testingtools.write_test(output, success_output, test, 'pages parsed when recrawling an unchanged site again', [], parsed, parsed == [])
+test = testingtools.write_snapshot_tests(output, success_output, test, 'after recrawling an unchanged site again', expected, testingtools.crawl_snapshot(urls(), words, queries))
+
+#Recrawling without saved crawl data performs a full crawl
+os.chdir(tempfile.mkdtemp())
+crawler.recrawl(server.seed_url, max_workers=4)
+test = testingtools.write_snapshot_tests(output, success_output, test, 'after recrawling without saved crawl data', expected, testingtools.crawl_snapshot(urls(), words, queries))
+
+#Crawl data saved in another format is left alone
+for output_format in ['jsonl', 'sqlite']:
+  os.chdir(tempfile.mkdtemp())
+  crawler.crawl(server.seed_url, max_workers=4, output=output_format)
+  files = sorted(os.listdir('.'))
+  try:
+    crawler.recrawl(server.seed_url, max_workers=4)
+    result = 'no error'
+  except ValueError:
+    result = 'ValueError'
+  test = testingtools.write_test(output, success_output, test, 'recrawling crawl data saved with output=' + output_format, 'ValueError', result, result == 'ValueError')
+  test = testingtools.write_test(output, success_output, test, 'files after recrawling crawl data saved with output=' + output_format, files, sorted(os.listdir('.')),
+                                 files == sorted(os.listdir('.')))
+
+server.close()
+output.close()
+success_output.close()
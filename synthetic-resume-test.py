@@ -0,0 +1,100 @@
+import os
+import asyncio
+import tempfile
+import testingtools
+import crawler
+import sitegen
+import webdev
+output = open(os.path.abspath('synthetic-resume-failed.txt'), 'w')
+success_output = open(os.path.abspath('synthetic-resume-passed.txt'), 'w')
+
+#Crawls of two local synthetic sites are interrupted part way through and resumed from their checkpoint,
+#then checked against uninterrupted crawls of the same sites
+words = sitegen.FRUITS[:6]
+queries = ['apple', 'kiwi banana kiwi', 'pear fig coconut']
+sites = []
+for seed in [1, 2]:
+  site = sitegen.SyntheticSite(300, min_links=2, max_links=8, seed=seed)
+  server = sitegen.SiteServer(site)
+  sites.append((site, server, [server.base_url + site.page_name(page) for page in range(len(site))]))
+
+real_fetch_attempt = webdev.fetch_attempt
+real_fetch_attempt_async = webdev.fetch_attempt_async
+fetches = [0]
+crash_after = [None]
+
+#counts fetch attempts, raising KeyboardInterrupt once crash_after of them have been made
+def counting_fetch_attempt(*args, **kwargs):
+  fetches[0] += 1
+  if crash_after[0] is not None and fetches[0] > crash_after[0]:
+    raise KeyboardInterrupt
+  return real_fetch_attempt(*args, **kwargs)
+
+async def counting_fetch_attempt_async(*args, **kwargs):
+  fetches[0] += 1
+  if crash_after[0] is not None and fetches[0] > crash_after[0]:
+    raise KeyboardInterrupt
+  return await real_fetch_attempt_async(*args, **kwargs)
+
+webdev.fetch_attempt = counting_fetch_attempt
+webdev.fetch_attempt_async = counting_fetch_attempt_async
+
+def crawl(server, mode, **kwargs):
+  if mode == 'async':
+    return asyncio.run(crawler.crawl_async(server.seed_url, concurrency=16, **kwargs))
+  return crawler.crawl(server.seed_url, max_workers=4, **kwargs)
+
+#Performing an uninterrupted crawl of each site starting at its seed
+expected = []
+for site, server, urls in sites:
+  os.chdir(tempfile.mkdtemp())
+  crawl(server, 'sync')
+  expected.append(testingtools.crawl_snapshot(urls, words, queries))
+test = 0
+
+#Every crawl is interrupted before any is resumed, and consecutive crawls are of different sites,
+#so each resumed crawl follows queries about another site's crawl
+crawls = []
+for output_format in ['json', 'jsonl', 'sqlite']:
+  for mode, memory_budget in [('sync', None), ('sync', 50), ('async', None)]:
+    which = len(crawls) % len(sites)
+    description = 'a {} crawl of site {} with output={} and memory_budget={}'.format(mode, which, output_format, memory_budget)
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+    fetches[0] = 0
+    crash_after[0] = 150
+    try:
+      crawl(sites[which][1], mode, output=output_format, memory_budget=memory_budget, checkpoint_every=25)
+    except KeyboardInterrupt:
+      pass
+    test = testingtools.write_test(output, success_output, test, 'that a checkpoint is left by interrupting ' + description,
+                                   True, os.path.exists(crawler.CHECKPOINT_FILE), os.path.exists(crawler.CHECKPOINT_FILE))
+    crawls.append((directory, which, mode, output_format, memory_budget, description))
+
+crash_after[0] = None
+for directory, which, mode, output_format, memory_budget, description in crawls:
+  site, server, urls = sites[which]
+  description = 'after resuming ' + description
+  os.chdir(directory)
+  fetches[0] = 0
+  result_pages = crawl(server, mode, output=output_format, memory_budget=memory_budget, checkpoint_every=25, resume=True)
+  test = testingtools.write_test(output, success_output, test, 'number of pages ' + description, len(site), result_pages, result_pages == len(site))
+  test = testingtools.write_test(output, success_output, test, 'that pages are not all fetched again ' + description,
+                                 'fewer than {} fetches'.format(len(site)), fetches[0], fetches[0] < len(site))
+  test = testingtools.write_test(output, success_output, test, 'that the checkpoint is removed ' + description,
+                                 False, os.path.exists(crawler.CHECKPOINT_FILE), not os.path.exists(crawler.CHECKPOINT_FILE))
+  test = testingtools.write_snapshot_tests(output, success_output, test, description, expected[which], testingtools.crawl_snapshot(urls, words, queries))
+
+#A checkpoint file that was created but never written to, e.g. by a crash right after the crawl started,
+#is not a checkpoint, so resuming crawls the site from the start
+site, server, urls = sites[0]
+os.chdir(tempfile.mkdtemp())
+open(crawler.CHECKPOINT_FILE, 'w').close()
+result_pages = crawl(server, 'sync', resume=True)
+test = testingtools.write_test(output, success_output, test, 'number of pages after resuming from an empty checkpoint file', len(site), result_pages, result_pages == len(site))
+test = testingtools.write_snapshot_tests(output, success_output, test, 'after resuming from an empty checkpoint file', expected[0], testingtools.crawl_snapshot(urls, words, queries))
+
+for site, server, urls in sites:
+  server.close()
+output.close()
+success_output.close()
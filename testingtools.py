@@ -1,4 +1,6 @@
 import math
+import searchdata
+import search
 
 def compare_doubles(a, b):
     return abs(a-b) < 0.0001
@@ -95,4 +97,65 @@ def compare_search_results(student, expected, k=10, tol=1e-6):
     return True
 
 
-    
\ No newline at end of file
+    
+
+
+#returns what searchdata and search give for the current directory's crawl, by the name of each check:
+#the crawled pages, the links, page rank, tf and tf-idf of urls, the idf of words and the results of queries
+def crawl_snapshot(urls, words, queries):
+    snapshot = {}
+    snapshot["crawled pages"] = {"all": searchdata._crawled_urls()}
+    snapshot["outgoing links"] = {url: searchdata.get_outgoing_links(url) for url in urls}
+    snapshot["incoming links"] = {url: searchdata.get_incoming_links(url) for url in urls}
+    snapshot["page rank"] = {url: searchdata.get_page_rank(url) for url in urls}
+    snapshot["idf"] = {word: searchdata.get_idf(word) for word in words}
+    snapshot["tf"] = {(url, word): searchdata.get_tf(url, word) for url in urls for word in words}
+    snapshot["tf-idf"] = {(url, word): searchdata.get_tf_idf(url, word) for url in urls for word in words}
+    snapshot["search results"] = {(query, boost): search.search(query, boost) for query in queries for boost in (False, True)}
+    return snapshot
+
+
+#returns the keys whose values differ between the expected and resulting values of one check of two crawl snapshots
+#floats are compared with compare_doubles, lists of links without regard to order and search results as the fruits tests do
+def compare_snapshot_values(expected, result):
+    differing = []
+    for key in expected.keys() | result.keys():
+        a = expected.get(key)
+        b = result.get(key)
+        if isinstance(a, float) and isinstance(b, float):
+            same = compare_doubles(a, b)
+        elif a and b and isinstance(a, list) and isinstance(a[0], dict):
+            same = compare_search_results(b, a, k=len(a))
+        elif isinstance(a, list):
+            same = compare_unsorted_lists(a, b)
+        else:
+            same = a == b
+        if not same:
+            differing.append(key)
+    return differing
+
+
+#writes one test per check comparing two crawl snapshots to the failed and passed output files, fruits test style
+#returns the number of the next test
+def write_snapshot_tests(output, success_output, test, description, expected, result):
+    for check in expected:
+        differing = compare_snapshot_values(expected[check], result[check])
+        if differing:
+            shown = sorted(differing, key=str)[:5]
+            output.write("Failed Test #{} checking {} {} ({} of {} differ)\n\n".format(test, check, description, len(differing), len(expected[check])))
+            output.write("expected = {}\n".format(str({key: expected[check].get(key) for key in shown})))
+            output.write("result = {}\n\n\n".format(str({key: result[check].get(key) for key in shown})))
+        else:
+            success_output.write("Passed Test #{} checking {} {} ({} values)\n\n\n".format(test, check, description, len(expected[check])))
+        test += 1
+    return test
+
+
+#writes one test of a single expected value to the failed or passed output file, fruits test style
+#returns the number of the next test
+def write_test(output, success_output, test, description, expected, result, passed):
+    out = success_output if passed else output
+    out.write("{} Test #{} checking {}\n\n".format("Passed" if passed else "Failed", test, description))
+    out.write("expected = {}\n".format(str(expected)))
+    out.write("result = {}\n\n\n".format(str(result)))
+    return test + 1
@@ -1,23 +1,962 @@
-import urllib.request
-import sys
-import time
-
-#returns the string contents of the page at url, or "" if there is an error
-def read_url(url):
-	fail_count = 0
-	sleep_time = 0.1
-	
-	while fail_count < 10:
-		time.sleep(sleep_time)
-		try:
-			fp = urllib.request.urlopen(url)
-			mybytes = fp.read()
-			mystr = mybytes.decode(sys.stdout.encoding)
-			fp.close()
-			return mystr
-		except:
-			fail_count += 1
-			sleep_time = sleep_time + 0.25
-			print("Failed to read " + url + "(#" + str(fail_count) + "), sleeping for " + str(sleep_time) + "seconds before retrying...")
-	print("COULD NOT READ THE URL!")
-	return ""
+import urllib.parse
+import http.client
+import hashlib
+import codecs
+import json
+import os
+import threading
+import asyncio
+import bisect
+import random
+import socket
+import ssl
+import sys
+import time
+import zlib
+
+#sent with every request
+USER_AGENT = "Python-urllib/%d.%d" % sys.version_info[:2]
+
+#content codings asked for with every request; response bodies are decompressed as they are read
+ACCEPT_ENCODING = "gzip, deflate"
+
+#returns the string contents of the page at url, or "" if there is an error
+def read_url(url):
+	return fetch(url)[2]
+
+#returns a (status, headers, contents) tuple for the page at url
+#extra request headers can be given, e.g. If-None-Match to make a conditional request
+#header names in the returned dict are lower case
+#contents is decoded with the charset given in the Content-Type header (see content_charset)
+#status is 304 with "" contents if a conditional request found the page unchanged;
+#if the page could not be read contents is "" and status is that of the last response, or 0 if there was none
+#temporary errors are retried with backoff (see fetch_attempt), sleeping on the calling thread in between
+def fetch(url, headers=None):
+	attempt = 0
+	while True:
+		status, response_headers, contents, retry_delay = fetch_attempt(url, headers, attempt)
+		if retry_delay is None:
+			return status, response_headers, contents
+		time.sleep(retry_delay)
+		if status != PARKED:
+			attempt += 1
+
+#maximum number of attempts made at a url before giving up on it
+MAX_ATTEMPTS = 6
+
+#the delay before retry n is random between 0 and min(BACKOFF_MAX, BACKOFF_BASE * 2**n) seconds
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 30.0
+
+#statuses below 500 that are worth retrying: request timeout and too many requests
+RETRY_STATUSES = (408, 429)
+
+#status of a fetch_attempt result when no request was made because the host's circuit breaker is open
+#the retry is due when the breaker lets requests through again and is made with the same attempt number,
+#so waiting out an outage never uses up a url's attempts
+PARKED = -1
+
+#makes a single attempt at fetching url, without sleeping between retries
+#returns (status, headers, contents, retry_delay), where the first three are as for fetch
+#retry_delay is None if the result is final: success, 304, a permanent error such as 404, or MAX_ATTEMPTS reached
+#otherwise it is the number of seconds to wait before trying again with attempt + 1
+#5xx statuses, RETRY_STATUSES and network errors or timeouts are temporary errors, retried with exponential backoff and jitter
+#while a host's circuit breaker is open no request is made: the status is PARKED and the delay is the time until it closes,
+#unless the host is taken to be down (see BREAKER_MAX_PROBES)
+#a url that is not an http or https URL with a host fails straight away with status 0, without a request
+#when a response cache is set (see set_cache) it is checked first, and responses are recorded in it
+#with decode=False the contents of a page are not decoded: they are a memoryview of the first bytes of
+#contents.obj, a buffer that the calling thread reuses for every response, so the view is only valid
+#until the same thread fetches another page; the page's charset is content_charset(headers)
+def fetch_attempt(url, headers=None, attempt=0, decode=True):
+	if not _fetchable(url):
+		return _not_fetchable()
+	cached = _from_cache(url, headers, decode)
+	if cached is not None:
+		return cached
+	breaker = _circuit_breaker(url)
+	parked = breaker.wait()
+	if parked:
+		return _parked(url, attempt, parked, breaker)
+	time.sleep(_rate_limiter(url).reserve())
+	timing = {"start": time.perf_counter()}
+	try:
+		status, response_headers, mybytes = _request(url, headers or {}, timing=timing)
+	except _ResponseTooLarge:
+		_record_fetch(url, attempt, 0, timing, "response too large")
+		breaker.record(url, True)
+		print("COULD NOT READ THE URL! (response larger than " + str(MAX_BODY_SIZE) + " bytes)")
+		return 0, {}, "", None
+	except Exception as e:
+		_record_fetch(url, attempt, 0, timing, type(e).__name__)
+		breaker.record(url, False)
+		return _retry_later(url, attempt, 0, {}, _backoff(attempt))
+	_record_fetch(url, attempt, status, timing)
+	_record_in_cache(url, status, response_headers, mybytes)
+	return _attempt_result(url, attempt, breaker, status, response_headers, mybytes, decode)
+
+#returns True if url is an http or https URL with a host, the only kind fetch_attempt makes requests for
+#anything else, such as a relative or mailto: URL, would otherwise be sent to the wrong server or none
+def _fetchable(url):
+	try:
+		parts = urllib.parse.urlsplit(url)
+		parts.port  #raises ValueError if the port is not a number
+	except ValueError:
+		return False
+	return parts.scheme in ("http", "https") and bool(parts.hostname)
+
+#final result of fetch_attempt for a url that is not fetchable, returned without a request or circuit breaker
+def _not_fetchable():
+	print("COULD NOT READ THE URL! (not an http or https URL)")
+	return 0, {}, "", None
+
+#turns the response to an attempt at url into the result of fetch_attempt
+def _attempt_result(url, attempt, breaker, status, headers, mybytes, decode=True):
+	if status >= 500 or status in RETRY_STATUSES:
+		#a 408 or 429 means the host is up but wants us to slow down, so only 5xx count towards the breaker
+		breaker.record(url, status < 500)
+		return _retry_later(url, attempt, status, headers, max(_backoff(attempt), _retry_after(headers)))
+	breaker.record(url, True)
+	if status == 304:
+		return 304, headers, "", None
+	if 200 <= status < 300:
+		if not decode:
+			return status, headers, mybytes, None
+		try:
+			return status, headers, str(mybytes, content_charset(headers)), None
+		except UnicodeDecodeError:
+			pass
+	print("COULD NOT READ THE URL! (HTTP status " + str(status) + ")")
+	return status, headers, "", None
+
+#returns the name of the charset given in the Content-Type of response headers,
+#or default if there is none or Python doesn't know it
+def content_charset(headers, default="utf-8"):
+	content_type = headers.get("content-type", "")
+	for param in content_type.split(";")[1:]:
+		name, _, value = param.partition("=")
+		if name.strip().lower() == "charset":
+			try:
+				return codecs.lookup(value.strip().strip("\"'")).name
+			except LookupError:
+				break
+	return default
+
+#result of a failed attempt at url that can be retried after delay seconds, unless it was the last attempt
+def _retry_later(url, attempt, status, headers, delay):
+	if attempt + 1 >= MAX_ATTEMPTS:
+		print("COULD NOT READ THE URL!")
+		return status, headers, "", None
+	print("Failed to read " + url + "(#" + str(attempt + 1) + "), retrying in " + ("%.2f" % delay) + " seconds...")
+	return status, headers, "", delay
+
+#result of an attempt at url that was not made because its host's circuit breaker is open for delay more seconds
+#a final result if the host is taken to be down, or if this was to be the url's last attempt anyway
+def _parked(url, attempt, delay, breaker):
+	if breaker.dead() or attempt + 1 >= MAX_ATTEMPTS:
+		print("COULD NOT READ THE URL! (host unavailable)")
+		return 0, {}, "", None
+	print("Host of " + url + " is unavailable, retrying in " + ("%.2f" % delay) + " seconds...")
+	return PARKED, {}, "", delay
+
+#returns a random backoff delay for retry number attempt + 1 ("full jitter")
+def _backoff(attempt):
+	return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+#returns the delay in seconds asked for by a Retry-After header, or 0 if there is none
+#HTTP dates are not supported; the delay is capped at BACKOFF_MAX
+def _retry_after(headers):
+	try:
+		return min(BACKOFF_MAX, max(0.0, float(headers.get("retry-after", 0))))
+	except ValueError:
+		return 0
+
+#a host is parked for BREAKER_COOLDOWN seconds after BREAKER_THRESHOLD consecutive failed attempts at more than one url,
+#so a single url failing all of its own attempts does not hold up anything else on its host
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+
+#a host whose breaker has seen this many probes in a row fail is taken to be down:
+#requests parked behind its breaker give up instead of waiting for yet another probe
+BREAKER_MAX_PROBES = 6
+
+_circuit_breakers = {}
+_breaker_lock = threading.Lock()
+
+#circuit breaker for one host, counting consecutive network errors and 5xx responses
+#once open, requests are held back until the cooldown ends; then a single probe request
+#is let through, which closes the breaker if it succeeds or opens it again if it fails
+class _CircuitBreaker:
+	def __init__(self):
+		self.failures = 0
+		self.failed_urls = set()  #distinct urls among the consecutive failures
+		self.failed_probes = 0
+		self.probing = False
+		self.open_until = 0
+		self.lock = threading.Lock()
+	
+	#returns 0 if a request may be made now, or the number of seconds until the breaker closes
+	def wait(self):
+		with self.lock:
+			now = time.monotonic()
+			if now < self.open_until:
+				return self.open_until - now
+			if self._tripped():
+				#half open: hold everyone else back until this probe has been recorded
+				self.open_until = now + BREAKER_COOLDOWN
+				self.probing = True
+			return 0
+	
+	#records whether the host handled a request for url
+	def record(self, url, ok):
+		with self.lock:
+			if ok:
+				self.failures = 0
+				self.failed_urls.clear()
+				self.failed_probes = 0
+				self.open_until = 0
+			else:
+				self.failures += 1
+				if len(self.failed_urls) < 2:
+					self.failed_urls.add(url)
+				if self.probing:
+					self.failed_probes += 1
+				if self._tripped():
+					self.open_until = time.monotonic() + BREAKER_COOLDOWN
+			self.probing = False
+	
+	#returns True if the consecutive failures are enough to open the breaker
+	def _tripped(self):
+		return self.failures >= BREAKER_THRESHOLD and len(self.failed_urls) > 1
+	
+	#returns True once the host is taken to be down (see BREAKER_MAX_PROBES)
+	def dead(self):
+		with self.lock:
+			return self.failed_probes >= BREAKER_MAX_PROBES
+
+#returns the circuit breaker for the host of url
+def _circuit_breaker(url):
+	host = urllib.parse.urlsplit(url).netloc.lower()
+	with _breaker_lock:
+		breaker = _circuit_breakers.get(host)
+		if breaker is None:
+			breaker = _circuit_breakers[host] = _CircuitBreaker()
+		return breaker
+
+#response cache modes:
+#None - no cache
+#"record" - fetch every page over the network and save the responses in the cache
+#"replay" - answer only from the cache, without any network access; pages that aren't cached can't be read
+#"auto" - answer from the cache when a page is in it, otherwise fetch it and record the response
+CACHE_MODES = (None, "record", "replay", "auto")
+
+_cache_mode = None
+_cache_dir = None
+_cache_lock = threading.Lock()
+
+#turns the on-disk response cache in directory on with the given mode, or off if mode is None
+#the cache can also be turned on for a whole run with the WEBDEV_CACHE (mode) and WEBDEV_CACHE_DIR environment variables
+#responses are kept per url: index/<sha1 of url>.json holds the status and headers and the
+#SHA-256 of the body, which is stored once in bodies/ under that hash no matter how many urls return it
+#only final responses (2xx and permanent errors) are recorded; bodies are stored decompressed
+def set_cache(mode, directory="webdev_cache"):
+	global _cache_mode, _cache_dir
+	if mode not in CACHE_MODES:
+		raise ValueError("cache mode must be one of " + str(CACHE_MODES) + ", not " + repr(mode))
+	with _cache_lock:
+		_cache_mode = mode
+		_cache_dir = directory
+
+#returns the fetch_attempt result for url from the cache, or None if the network should be used
+#a conditional request whose validators match the cached response gets a 304
+def _from_cache(url, headers, decode=True):
+	if _cache_mode not in ("replay", "auto"):
+		return None
+	entry = _cache_entry(url)
+	if entry is None:
+		if _cache_mode == "auto":
+			return None
+		print("COULD NOT READ THE URL! (" + url + " is not in the cache)")
+		return 0, {}, "", None
+	status, cached_headers = entry["status"], entry["headers"]
+	request_headers = {name.lower(): value for name, value in (headers or {}).items()}
+	if 200 <= status < 300 and (
+			("if-none-match" in request_headers and request_headers["if-none-match"] == cached_headers.get("etag")) or
+			("if-modified-since" in request_headers and request_headers["if-modified-since"] == cached_headers.get("last-modified"))):
+		return 304, cached_headers, "", None
+	with open(os.path.join(_cache_dir, "bodies", entry["body"]), "rb") as f:
+		mybytes = memoryview(f.read())
+	return _attempt_result(url, 0, _circuit_breaker(url), status, cached_headers, mybytes, decode)
+
+#saves the final response to a request for url in the cache, if it is recording
+def _record_in_cache(url, status, headers, mybytes):
+	if _cache_mode not in ("record", "auto") or status == 304 or status >= 500 or status in RETRY_STATUSES:
+		return
+	body_hash = hashlib.sha256(mybytes).hexdigest()
+	body_path = os.path.join(_cache_dir, "bodies", body_hash)
+	if not os.path.exists(body_path):
+		_write_atomically(body_path, mybytes)
+	entry = {"url": url, "status": status, "headers": headers, "body": body_hash}
+	_write_atomically(_cache_index_path(url), json.dumps(entry).encode("utf-8"))
+
+#returns the cached {"url", "status", "headers", "body"} entry for url, or None if it isn't cached
+def _cache_entry(url):
+	try:
+		with open(_cache_index_path(url), "rb") as f:
+			entry = json.loads(f.read().decode("utf-8"))
+	except FileNotFoundError:
+		return None
+	return entry if entry["url"] == url else None
+
+#path of the index file for url in the cache
+def _cache_index_path(url):
+	return os.path.join(_cache_dir, "index", hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+#writes data to path through a temporary file, so readers never see a partly written file
+def _write_atomically(path, data):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	temp_path = path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+	with open(temp_path, "wb") as f:
+		f.write(data)
+	os.replace(temp_path, path)
+
+set_cache(os.environ.get("WEBDEV_CACHE") or None, os.environ.get("WEBDEV_CACHE_DIR", "webdev_cache"))
+
+#default per-host rate limit: requests per second and burst size
+#a rate of None means requests to a host are never delayed, so by default a crawl runs as fast as its workers allow;
+#call set_rate_limit to be gentler with a remote site, e.g. set_rate_limit(10, 10) for at most 10 requests/sec per host
+#a default limit does not apply to loopback hosts, which are unlimited unless given their own limit
+DEFAULT_RATE = None
+DEFAULT_BURST = 1
+
+#per-host (rate, burst) limits that override the default, keyed by host[:port]
+_host_limits = {}
+_rate_limiters = {}
+_limiter_lock = threading.Lock()
+
+#sets the rate limit (requests per second, with bursts of up to burst requests) for one host,
+#or the default for every host without its own limit if host is None
+#a rate of None turns rate limiting off
+def set_rate_limit(rate, burst=1, host=None):
+	global DEFAULT_RATE, DEFAULT_BURST
+	with _limiter_lock:
+		if host is None:
+			DEFAULT_RATE, DEFAULT_BURST = rate, burst
+			_rate_limiters.clear()
+		else:
+			_host_limits[host.lower()] = (rate, burst)
+			_rate_limiters.pop(host.lower(), None)
+
+#token bucket limiting the request rate to one host
+#tokens refill at rate per second up to burst; a request that finds no token
+#reserves the next one and waits until it arrives, so concurrent callers are spaced out fairly
+class _TokenBucket:
+	def __init__(self, rate, burst):
+		self.rate = rate
+		self.burst = burst
+		self.tokens = burst
+		self.updated = time.monotonic()
+		self.lock = threading.Lock()
+	
+	#takes a token and returns how many seconds to wait before using it
+	def reserve(self):
+		if self.rate is None:
+			return 0
+		with self.lock:
+			now = time.monotonic()
+			self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+			self.updated = now
+			self.tokens -= 1
+			if self.tokens >= 0:
+				return 0
+			return -self.tokens / self.rate
+
+#returns the token bucket for the host of url
+def _rate_limiter(url):
+	parts = urllib.parse.urlsplit(url)
+	host = parts.netloc.lower()
+	with _limiter_lock:
+		limiter = _rate_limiters.get(host)
+		if limiter is None:
+			if host in _host_limits:
+				rate, burst = _host_limits[host]
+			elif parts.hostname in ("localhost", "::1") or (parts.hostname or "").startswith("127."):
+				rate, burst = None, 1
+			else:
+				rate, burst = DEFAULT_RATE, DEFAULT_BURST
+			limiter = _rate_limiters[host] = _TokenBucket(rate, burst)
+		return limiter
+
+#seconds to wait for a connection (including the TLS handshake) to be set up
+CONNECT_TIMEOUT = 10.0
+
+#seconds to wait for any data from the server, and the most the whole response may take to arrive
+#a request that times out is a network error, so it is retried like one
+READ_TIMEOUT = 30.0
+
+#responses with bodies larger than this many bytes are abandoned and not retried
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+#raised when a response body is larger than MAX_BODY_SIZE
+class _ResponseTooLarge(IOError):
+	pass
+
+#maximum number of idle keep-alive connections kept open to each host
+MAX_IDLE_PER_HOST = 16
+
+#idle persistent connections, keyed by (scheme, host, port)
+#connections are taken out while in use, so each one only ever serves one thread at a time
+_idle_connections = {}
+_pool_lock = threading.Lock()
+
+#performs one GET over a pooled persistent HTTP/1.1 connection
+#follows up to 5 redirects to http or https URLs and returns (status, headers, body) for the final response
+#the body is a memoryview of this thread's read buffer (see _ReadBuffer), already decompressed;
+#headers are as received, so they still name its Content-Encoding
+#timings (see _record_fetch) are added to the timing dict if one is given
+def _request(url, headers, redirects=5, timing=None):
+	if timing is None:
+		timing = {"start": time.perf_counter()}
+	parts = urllib.parse.urlsplit(url)
+	key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+	path = parts.path or "/"
+	if parts.query:
+		path += "?" + parts.query
+	request_headers = {"User-Agent": USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING}
+	request_headers.update(headers)
+	
+	deadline = time.monotonic() + READ_TIMEOUT
+	conn, reused = _get_connection(key, timing=timing)
+	timing["reused"] = reused
+	try:
+		try:
+			sent = time.perf_counter()
+			conn.request("GET", path, headers=request_headers)
+			response = conn.getresponse()
+		except (http.client.RemoteDisconnected, ConnectionError):
+			if not reused:
+				raise
+			#the server closed the idle connection, so try once more on a new one
+			conn.close()
+			conn, reused = _get_connection(key, fresh=True, timing=timing)
+			timing["reused"] = reused
+			sent = time.perf_counter()
+			conn.request("GET", path, headers=request_headers)
+			response = conn.getresponse()
+		timing["ttfb"] = time.perf_counter() - sent
+		body = _read_body(response, deadline, timing)
+	except:
+		conn.close()
+		raise
+	
+	if response.will_close:
+		conn.close()
+	else:
+		_release_connection(key, conn)
+	
+	response_headers = {name.lower(): value for name, value in response.getheaders()}
+	if response.status in (301, 302, 303, 307, 308) and "location" in response_headers and redirects > 0:
+		location = urllib.parse.urljoin(url, response_headers["location"])
+		if _fetchable(location):
+			return _request(location, headers, redirects - 1, timing)
+	return response.status, response_headers, body
+
+#reads and decompresses the body of a response into this thread's read buffer and returns a view of it
+#gives up if it is larger than MAX_BODY_SIZE or is still arriving at deadline
+#the bytes received and decoded are added to timing
+def _read_body(response, deadline, timing):
+	length = response.getheader("content-length")
+	if length and length.isdigit() and int(length) > MAX_BODY_SIZE:
+		raise _ResponseTooLarge(length + " bytes")
+	decoder = _BodyDecoder(response.getheader("content-encoding"), _thread_buffer())
+	while True:
+		chunk = response.read1(65536)
+		if not chunk:
+			response.read()  #marks the response finished so the connection can be reused
+			body = decoder.finish()
+			timing["wire_bytes"] = timing.get("wire_bytes", 0) + decoder.wire_bytes
+			timing["body_bytes"] = len(body)
+			return body
+		decoder.feed(chunk)
+		if time.monotonic() > deadline:
+			raise socket.timeout("response took longer than " + str(READ_TIMEOUT) + " seconds")
+
+#running totals over every response body read: bytes as received, and after decompression
+_transfer_stats = {"responses": 0, "wire_bytes": 0, "body_bytes": 0}
+_stats_lock = threading.Lock()
+
+#returns a dict with the number of response bodies read, the bytes received for them (wire_bytes)
+#and their size once decompressed (body_bytes), since the start or the last reset_transfer_stats()
+def transfer_stats():
+	with _stats_lock:
+		return dict(_transfer_stats)
+
+#sets the transfer_stats() counts back to 0
+def reset_transfer_stats():
+	with _stats_lock:
+		for name in _transfer_stats:
+			_transfer_stats[name] = 0
+
+#per-host fetch metrics, aggregated from a record of every request made (see _record_fetch)
+_host_metrics = {}
+_fetch_listeners = []
+_metrics_lock = threading.Lock()
+
+#returns a summary of the requests made to each host since the start or the last reset_fetch_metrics(),
+#as a dict of host -> {"requests", "errors", "retries", "statuses", "wire_bytes", "body_bytes", "latency"}
+#errors counts requests that got no response, statuses counts the others by HTTP status,
+#and latency has percentiles of the dns, connect, ttfb and total times in seconds (see _Histogram.summary)
+def fetch_metrics():
+	with _metrics_lock:
+		return {host: metrics.summary() for host, metrics in _host_metrics.items()}
+
+#clears the fetch_metrics() totals
+def reset_fetch_metrics():
+	with _metrics_lock:
+		_host_metrics.clear()
+
+#calls callback with the record of every request from now on (see _record_fetch)
+#callbacks run on the thread that made the request, so they should be quick
+def add_fetch_listener(callback):
+	with _metrics_lock:
+		_fetch_listeners.append(callback)
+
+#stops calling a callback given to add_fetch_listener
+def remove_fetch_listener(callback):
+	with _metrics_lock:
+		_fetch_listeners.remove(callback)
+
+#records one request for url that got the given status (0 if there was no response, with error naming why)
+#the record is a dict with the url, host, status, error, attempt (the number of earlier failed attempts),
+#whether a kept-alive connection was reused, and the dns, connect, ttfb (time to first byte)
+#and total latencies in seconds along with the bytes received (wire_bytes) and decoded (body_bytes)
+#dns and connect are None on a reused connection; anything not reached before an error is None
+def _record_fetch(url, attempt, status, timing, error=None):
+	record = {
+		"url": url,
+		"host": urllib.parse.urlsplit(url).netloc.lower(),
+		"status": status,
+		"error": error,
+		"attempt": attempt,
+		"reused": timing.get("reused", False),
+		"dns": timing.get("dns"),
+		"connect": timing.get("connect"),
+		"ttfb": timing.get("ttfb"),
+		"total": time.perf_counter() - timing["start"],
+		"wire_bytes": timing.get("wire_bytes", 0),
+		"body_bytes": timing.get("body_bytes", 0),
+	}
+	with _metrics_lock:
+		metrics = _host_metrics.get(record["host"])
+		if metrics is None:
+			metrics = _host_metrics[record["host"]] = _HostMetrics()
+		metrics.add(record)
+		limit = _concurrency_limits.get(record["host"])
+		if limit is None:
+			limit = _concurrency_limits[record["host"]] = _AdaptiveLimit()
+		limit.add(record)
+		listeners = list(_fetch_listeners)
+	for callback in listeners:
+		callback(record)
+
+#adaptive per-host concurrency (see _AdaptiveLimit): the limit starts at ADAPTIVE_INITIAL and stays between
+#ADAPTIVE_MIN and ADAPTIVE_MAX; it grows while the time to first byte stays within ADAPTIVE_LATENCY_FACTOR times
+#the fastest seen from the host (or ADAPTIVE_LATENCY_FLOOR seconds, if that is more) and the recent error rate
+#is at most ADAPTIVE_ERROR_TARGET, and is multiplied by ADAPTIVE_DECREASE on a timeout, network error or 5xx
+ADAPTIVE_INITIAL = 4
+ADAPTIVE_MIN = 1
+ADAPTIVE_MAX = 256
+ADAPTIVE_LATENCY_FACTOR = 3.0
+ADAPTIVE_LATENCY_FLOOR = 0.05
+ADAPTIVE_ERROR_TARGET = 0.05
+ADAPTIVE_DECREASE = 0.5
+
+_concurrency_limits = {}
+
+#returns how many requests to the host of url may be in flight at once, as learned from
+#the timings of the requests made to it so far; a crawler keeping this many requests in flight
+#finds the most a host can take without slowing down or failing
+def concurrency_limit(url):
+	host = urllib.parse.urlsplit(url).netloc.lower()
+	with _metrics_lock:
+		limit = _concurrency_limits.get(host)
+		return int(limit.limit) if limit is not None else ADAPTIVE_INITIAL
+
+#forgets the learned concurrency limits, so every host starts again from ADAPTIVE_INITIAL
+def reset_concurrency_limits():
+	with _metrics_lock:
+		_concurrency_limits.clear()
+
+#additive increase, multiplicative decrease (AIMD) of the concurrency limit for one host
+#each request that succeeds within the latency and error targets adds 1/limit, so the limit grows by about
+#one for every limit requests; a timeout, network error or 5xx cuts it by ADAPTIVE_DECREASE, but only once
+#for the requests that were already in flight when it was last cut, which were sent at the old limit
+#429 and 408 responses are cut for too, as the host is asking for less load
+class _AdaptiveLimit:
+	def __init__(self):
+		self.limit = float(ADAPTIVE_INITIAL)
+		self.fastest = None
+		self.error_rate = 0.0
+		self.cut_at = 0.0
+	
+	def add(self, record):
+		now = time.perf_counter()
+		overloaded = record["status"] >= 500 or record["status"] in RETRY_STATUSES or \
+			(not record["status"] and record["error"] != "response too large")
+		self.error_rate += ((1.0 if overloaded else 0.0) - self.error_rate) * 0.1
+		if overloaded:
+			if now - record["total"] >= self.cut_at:
+				self.limit = max(ADAPTIVE_MIN, self.limit * ADAPTIVE_DECREASE)
+				self.cut_at = now
+			return
+		latency = record["ttfb"] if record["ttfb"] is not None else record["total"]
+		if self.fastest is None or latency < self.fastest:
+			self.fastest = latency
+		target = max(ADAPTIVE_LATENCY_FLOOR, ADAPTIVE_LATENCY_FACTOR * self.fastest)
+		if latency <= target and self.error_rate <= ADAPTIVE_ERROR_TARGET:
+			self.limit = min(ADAPTIVE_MAX, self.limit + 1.0 / self.limit)
+
+#running totals and latency histograms for the requests made to one host
+class _HostMetrics:
+	LATENCIES = ("dns", "connect", "ttfb", "total")
+	
+	def __init__(self):
+		self.requests = 0
+		self.errors = 0
+		self.retries = 0
+		self.statuses = {}
+		self.wire_bytes = 0
+		self.body_bytes = 0
+		self.latency = {name: _Histogram() for name in self.LATENCIES}
+	
+	def add(self, record):
+		self.requests += 1
+		if record["status"]:
+			self.statuses[record["status"]] = self.statuses.get(record["status"], 0) + 1
+		else:
+			self.errors += 1
+		if record["attempt"]:
+			self.retries += 1
+		self.wire_bytes += record["wire_bytes"]
+		self.body_bytes += record["body_bytes"]
+		for name in self.LATENCIES:
+			if record[name] is not None:
+				self.latency[name].add(record[name])
+	
+	def summary(self):
+		return {
+			"requests": self.requests,
+			"errors": self.errors,
+			"retries": self.retries,
+			"statuses": dict(self.statuses),
+			"wire_bytes": self.wire_bytes,
+			"body_bytes": self.body_bytes,
+			"latency": {name: histogram.summary() for name, histogram in self.latency.items()},
+		}
+
+#latency histogram with logarithmic buckets from 0.1ms to about 10 minutes, each 19% wider than the last
+#percentiles are the upper bound of the bucket they fall in, so they are at most 19% too high
+class _Histogram:
+	BOUNDS = [0.0001 * 1.19 ** i for i in range(100)]
+	
+	def __init__(self):
+		self.counts = [0] * (len(self.BOUNDS) + 1)
+		self.count = 0
+		self.sum = 0.0
+		self.max = 0.0
+	
+	def add(self, value):
+		self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+		self.count += 1
+		self.sum += value
+		self.max = max(self.max, value)
+	
+	#returns the value that a fraction q of the recorded values are at or below
+	def percentile(self, q):
+		target = q * self.count
+		seen = 0
+		for i, count in enumerate(self.counts):
+			seen += count
+			if seen >= target and count:
+				return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+		return self.max
+	
+	#returns {"count", "mean", "p50", "p90", "p99", "max"}
+	def summary(self):
+		return {
+			"count": self.count,
+			"mean": self.sum / self.count if self.count else 0.0,
+			"p50": self.percentile(0.5),
+			"p90": self.percentile(0.9),
+			"p99": self.percentile(0.99),
+			"max": self.max,
+		}
+
+#growable byte buffer that response bodies are read into
+#each thread reads every response into the same buffer (see _thread_buffer), so once it is as big as
+#the largest page no memory is allocated for bodies; readers get a memoryview of the first length bytes
+class _ReadBuffer:
+	def __init__(self, size=65536):
+		self.data = bytearray(size)
+		self.length = 0
+	
+	#empties the buffer, keeping its memory
+	def clear(self):
+		self.length = 0
+	
+	#adds bytes to the end of the buffer
+	def append(self, chunk):
+		end = self.length + len(chunk)
+		if end > len(self.data):
+			#views of the old bytearray may still be in use, so grow into a new one instead of resizing it
+			grown = bytearray(max(end, 2 * len(self.data)))
+			grown[:self.length] = memoryview(self.data)[:self.length]
+			self.data = grown
+		self.data[self.length:end] = chunk
+		self.length = end
+	
+	#returns a memoryview of the bytes in the buffer
+	def view(self):
+		return memoryview(self.data)[:self.length]
+
+_thread_buffers = threading.local()
+
+#returns the calling thread's read buffer
+def _thread_buffer():
+	buffer = getattr(_thread_buffers, "buffer", None)
+	if buffer is None:
+		buffer = _thread_buffers.buffer = _ReadBuffer()
+	return buffer
+
+#incrementally decodes a response body sent with the given Content-Encoding (gzip, deflate or none) into buffer
+#raises _ResponseTooLarge as soon as the decoded body is larger than MAX_BODY_SIZE,
+#so a small compressed response can't expand into a huge one
+class _BodyDecoder:
+	def __init__(self, encoding, buffer):
+		encoding = (encoding or "").strip().lower()
+		self.wire_bytes = 0
+		self.body = buffer
+		self.body.clear()
+		if encoding in ("gzip", "x-gzip"):
+			self.zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+		elif encoding == "deflate":
+			self.zlib = zlib.decompressobj()
+		else:
+			self.zlib = None
+		self.deflate = encoding == "deflate"
+	
+	#decodes the next piece of the body as received
+	def feed(self, data):
+		self.wire_bytes += len(data)
+		if self.zlib is None:
+			self.body.append(data)
+		else:
+			try:
+				decoded = self.zlib.decompress(data, MAX_BODY_SIZE + 1 - self.body.length)
+			except zlib.error:
+				if not self.deflate or self.wire_bytes != len(data):
+					raise
+				#some servers send deflate data without the zlib header, so start again as raw deflate
+				self.zlib = zlib.decompressobj(-zlib.MAX_WBITS)
+				decoded = self.zlib.decompress(data, MAX_BODY_SIZE + 1 - self.body.length)
+			self.body.append(decoded)
+			if self.zlib.unconsumed_tail:
+				raise _ResponseTooLarge("more than " + str(MAX_BODY_SIZE) + " bytes once decompressed")
+		if self.body.length > MAX_BODY_SIZE:
+			raise _ResponseTooLarge("more than " + str(MAX_BODY_SIZE) + " bytes")
+	
+	#returns a view of the whole decoded body and adds it to the transfer stats
+	def finish(self):
+		if self.zlib is not None:
+			self.body.append(self.zlib.flush())
+		with _stats_lock:
+			_transfer_stats["responses"] += 1
+			_transfer_stats["wire_bytes"] += self.wire_bytes
+			_transfer_stats["body_bytes"] += self.body.length
+		return self.body.view()
+
+#returns (connection, reused) for a host, reusing an idle connection unless fresh is True
+#new connections are opened here under CONNECT_TIMEOUT, then reads on them time out after READ_TIMEOUT
+#the time taken to look up the host and to connect to it are added to timing for a new connection
+def _get_connection(key, fresh=False, timing=None):
+	if not fresh:
+		with _pool_lock:
+			idle = _idle_connections.get(key)
+			if idle:
+				return idle.pop(), True
+	scheme, host, port = key
+	sock = _open_socket(host, port, timing if timing is not None else {})
+	if scheme == "https":
+		context = ssl.create_default_context()
+		conn = http.client.HTTPSConnection(host, port, timeout=CONNECT_TIMEOUT, context=context)
+		try:
+			sock = context.wrap_socket(sock, server_hostname=host)
+		except:
+			sock.close()
+			raise
+		if timing is not None:
+			timing["connect"] = time.perf_counter() - timing["connect_start"]
+	else:
+		conn = http.client.HTTPConnection(host, port, timeout=CONNECT_TIMEOUT)
+	sock.settimeout(READ_TIMEOUT)
+	conn.sock = sock
+	return conn, False
+
+#resolves host and opens a TCP connection to it, trying each address in turn
+#records the lookup time as timing["dns"] and the connect time as timing["connect"]
+def _open_socket(host, port, timing):
+	started = time.perf_counter()
+	addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+	timing["connect_start"] = time.perf_counter()
+	timing["dns"] = timing["connect_start"] - started
+	error = None
+	for family, socktype, proto, _, address in addresses:
+		sock = socket.socket(family, socktype, proto)
+		try:
+			sock.settimeout(CONNECT_TIMEOUT)
+			sock.connect(address)
+			sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		except OSError as e:
+			sock.close()
+			error = e
+			continue
+		timing["connect"] = time.perf_counter() - timing["connect_start"]
+		return sock
+	raise error or OSError("no addresses found for " + host)
+
+#puts a connection back in the pool once its response has been read
+def _release_connection(key, conn):
+	with _pool_lock:
+		idle = _idle_connections.setdefault(key, [])
+		if len(idle) < MAX_IDLE_PER_HOST:
+			idle.append(conn)
+			return
+	conn.close()
+
+#coroutine version of read_url for use on an asyncio event loop
+#the request is made over asyncio streams so no thread is blocked while waiting
+async def read_url_async(url):
+	attempt = 0
+	while True:
+		status, _, contents, retry_delay = await fetch_attempt_async(url, attempt)
+		if retry_delay is None:
+			return contents
+		await asyncio.sleep(retry_delay)
+		if status != PARKED:
+			attempt += 1
+
+#coroutine version of fetch_attempt, with the same retry policy and circuit breaker
+#with decode=False contents is a memoryview of a buffer of its own, since many requests share the thread
+async def fetch_attempt_async(url, attempt=0, decode=True):
+	if not _fetchable(url):
+		return _not_fetchable()
+	cached = _from_cache(url, None, decode)
+	if cached is not None:
+		return cached
+	breaker = _circuit_breaker(url)
+	parked = breaker.wait()
+	if parked:
+		return _parked(url, attempt, parked, breaker)
+	await asyncio.sleep(_rate_limiter(url).reserve())
+	timing = {"start": time.perf_counter()}
+	try:
+		status, headers, mybytes = await _get_async(url, timing=timing)
+	except _ResponseTooLarge:
+		_record_fetch(url, attempt, 0, timing, "response too large")
+		breaker.record(url, True)
+		print("COULD NOT READ THE URL! (response larger than " + str(MAX_BODY_SIZE) + " bytes)")
+		return 0, {}, "", None
+	except Exception as e:
+		_record_fetch(url, attempt, 0, timing, type(e).__name__)
+		breaker.record(url, False)
+		return _retry_later(url, attempt, 0, {}, _backoff(attempt))
+	_record_fetch(url, attempt, status, timing)
+	_record_in_cache(url, status, headers, mybytes)
+	return _attempt_result(url, attempt, breaker, status, headers, mybytes, decode)
+
+#performs a single HTTP/1.1 GET over asyncio streams
+#follows up to 5 redirects to http or https URLs and returns (status, headers, body memoryview) for the final response
+#timings (see _record_fetch) are added to the timing dict if one is given
+async def _get_async(url, redirects=5, timing=None):
+	if timing is None:
+		timing = {"start": time.perf_counter()}
+	parts = urllib.parse.urlsplit(url)
+	https = parts.scheme == "https"
+	port = parts.port or (443 if https else 80)
+	
+	reader, writer = await _open_connection_async(parts.hostname, port, https, timing)
+	try:
+		status, headers, body = await asyncio.wait_for(_read_response_async(reader, writer, parts, timing), READ_TIMEOUT)
+	finally:
+		writer.close()
+	
+	if status in (301, 302, 303, 307, 308) and "location" in headers and redirects > 0:
+		location = urllib.parse.urljoin(url, headers["location"])
+		if _fetchable(location):
+			return await _get_async(location, redirects - 1, timing)
+	return status, headers, body
+
+#coroutine version of _open_socket: opens a stream to host, trying each of its addresses in turn
+#with up to CONNECT_TIMEOUT seconds for each, and records the DNS and connect times in timing
+async def _open_connection_async(host, port, https, timing):
+	started = time.perf_counter()
+	addresses = await asyncio.wait_for(asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM), CONNECT_TIMEOUT)
+	connect_start = time.perf_counter()
+	timing["dns"] = connect_start - started
+	error = None
+	for family, _, _, _, address in addresses:
+		connecting = asyncio.open_connection(address[0], port, family=family, ssl=ssl.create_default_context() if https else None,
+			server_hostname=host if https else None)
+		try:
+			reader, writer = await asyncio.wait_for(connecting, CONNECT_TIMEOUT)
+		except (OSError, asyncio.TimeoutError) as e:
+			error = e
+			continue
+		timing["connect"] = time.perf_counter() - connect_start
+		return reader, writer
+	raise error or OSError("no addresses found for " + host)
+
+#sends a GET for the url split into parts over an open stream and returns (status, headers, decompressed body view)
+#raises _ResponseTooLarge if the body is larger than MAX_BODY_SIZE
+#the time to first byte and the bytes received and decoded are added to timing
+async def _read_response_async(reader, writer, parts, timing):
+	path = parts.path or "/"
+	if parts.query:
+		path += "?" + parts.query
+	request = "GET " + path + " HTTP/1.1\r\nHost: " + parts.netloc + "\r\nConnection: close\r\nUser-Agent: " + USER_AGENT + "\r\nAccept-Encoding: " + ACCEPT_ENCODING + "\r\n\r\n"
+	sent = time.perf_counter()
+	writer.write(request.encode("ascii"))
+	await writer.drain()
+	
+	status = int((await reader.readline()).split()[1])
+	timing["ttfb"] = time.perf_counter() - sent
+	headers = {}
+	while True:
+		line = await reader.readline()
+		if line in (b"\r\n", b"\n", b""):
+			break
+		name, _, value = line.decode("latin-1").partition(":")
+		headers[name.strip().lower()] = value.strip()
+	
+	decoder = _BodyDecoder(headers.get("content-encoding"), _ReadBuffer())
+	if headers.get("transfer-encoding", "").lower() == "chunked":
+		while True:
+			size = int((await reader.readline()).split(b";")[0], 16)
+			if size == 0:
+				break
+			decoder.feed(await reader.readexactly(size))
+			await reader.readline()
+	elif "content-length" in headers:
+		if int(headers["content-length"]) > MAX_BODY_SIZE:
+			raise _ResponseTooLarge(headers["content-length"] + " bytes")
+		decoder.feed(await reader.readexactly(int(headers["content-length"])))
+	else:
+		while True:
+			chunk = await reader.read(65536)
+			if not chunk:
+				break
+			decoder.feed(chunk)
+	body = decoder.finish()
+	timing["wire_bytes"] = timing.get("wire_bytes", 0) + decoder.wire_bytes
+	timing["body_bytes"] = len(body)
+	return status, headers, body